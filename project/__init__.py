@@ -10,15 +10,24 @@ from project.graph_funcs import *
 import project.regex
 from project.regex import *
 
+import project.bit_matrix
+from project.bit_matrix import *
+
 import project.matrix
 from project.matrix import *
 
 import project.matrix_utils
 from project.matrix_utils import *
 
+import project.graph_index
+from project.graph_index import *
+
 import project.rpq
 from project.rpq import *
 
+import project.incremental_rpq
+from project.incremental_rpq import *
+
 import project.cfg
 from project.cfg import *
 
@@ -43,5 +52,8 @@ from project.wcnf_utils import *
 import project.cfpq_algorithms
 from project.cfpq_algorithms import *
 
+import project.multiple_source_cfpq
+from project.multiple_source_cfpq import *
+
 import project.cfpq
 from project.cfpq import *
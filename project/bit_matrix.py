@@ -0,0 +1,216 @@
+from typing import Tuple
+
+import numpy as np
+from scipy import sparse
+
+__all__ = ["BitMatrix"]
+
+_WORD_SIZE = 64
+_CHUNK_SIZE = 8
+_NONZERO_BLOCK = 1 << 24
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class BitMatrix:
+    """
+    Dense boolean matrix with rows packed into 64-bit words.
+    Column j of a row is stored in bit j % 64 of word j // 64.
+
+    Attributes
+    ----------
+    shape: Tuple[int, int]
+        Shape of the matrix
+    words: np.ndarray
+        Array of shape (rows, ceil(columns / 64)) with dtype uint64
+    """
+
+    def __init__(self, shape: Tuple[int, int], words: np.ndarray = None):
+        self.shape = (int(shape[0]), int(shape[1]))
+        if words is None:
+            words = np.zeros(
+                (self.shape[0], self._words_count(self.shape[1])), dtype=np.uint64
+            )
+        self.words = words
+
+    @staticmethod
+    def _words_count(columns: int) -> int:
+        return (columns + _WORD_SIZE - 1) // _WORD_SIZE
+
+    @classmethod
+    def from_sparse(cls, matrix) -> "BitMatrix":
+        """
+        Packs scipy sparse (or dense) matrix into BitMatrix
+
+        Parameters
+        ----------
+        matrix: spmatrix
+            Matrix to pack, every nonzero is treated as True
+
+        Returns
+        -------
+        bit_matrix: BitMatrix
+            Packed matrix
+        """
+        coo = sparse.coo_matrix(matrix)
+        mask = coo.data != 0
+        rows = coo.row[mask].astype(np.int64)
+        cols = coo.col[mask].astype(np.uint64)
+        bm = cls(coo.shape)
+        np.bitwise_or.at(
+            bm.words,
+            (rows, (cols >> np.uint64(6)).astype(np.int64)),
+            np.uint64(1) << (cols & np.uint64(_WORD_SIZE - 1)),
+        )
+        return bm
+
+    @classmethod
+    def identity(cls, n: int) -> "BitMatrix":
+        """
+        Creates identity BitMatrix of size n x n
+        """
+        return cls.from_sparse(sparse.identity(n, dtype=bool, format="coo"))
+
+    def to_sparse(self) -> sparse.csr_matrix:
+        """
+        Unpacks BitMatrix into scipy csr_matrix with bool dtype
+        """
+        rows, cols = self.nonzero()
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=self.shape
+        )
+
+    def toarray(self) -> np.ndarray:
+        return self.to_sparse().toarray()
+
+    def _unpack_rows(self, start: int, stop: int) -> np.ndarray:
+        block = np.ascontiguousarray(self.words[start:stop]).astype("<u8", copy=False)
+        return np.unpackbits(block.view(np.uint8), axis=1, bitorder="little")[
+            :, : self.shape[1]
+        ]
+
+    def nonzero(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns indices of all True elements, like spmatrix.nonzero
+        """
+        block_rows = max(1, _NONZERO_BLOCK // max(1, self.shape[1]))
+        all_rows, all_cols = [], []
+        for start in range(0, self.shape[0], block_rows):
+            rows, cols = np.nonzero(self._unpack_rows(start, start + block_rows))
+            all_rows.append(rows + start)
+            all_cols.append(cols)
+        if not all_rows:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        return np.concatenate(all_rows), np.concatenate(all_cols)
+
+    @property
+    def nnz(self) -> int:
+        return int(_POPCOUNT[self.words.view(np.uint8)].sum(dtype=np.int64))
+
+    def sum(self) -> int:
+        return self.nnz
+
+    def copy(self) -> "BitMatrix":
+        return BitMatrix(self.shape, self.words.copy())
+
+    def transpose(self) -> "BitMatrix":
+        return BitMatrix.from_sparse(self.to_sparse().transpose())
+
+    @property
+    def T(self) -> "BitMatrix":
+        return self.transpose()
+
+    def __getitem__(self, index: Tuple[int, int]) -> bool:
+        i, j = index
+        return bool(
+            (self.words[i, j // _WORD_SIZE] >> np.uint64(j % _WORD_SIZE)) & np.uint64(1)
+        )
+
+    def __setitem__(self, index: Tuple[int, int], value: bool):
+        i, j = index
+        bit = np.uint64(1) << np.uint64(j % _WORD_SIZE)
+        if value:
+            self.words[i, j // _WORD_SIZE] |= bit
+        else:
+            self.words[i, j // _WORD_SIZE] &= ~bit
+
+    def _check_shape(self, other: "BitMatrix"):
+        if self.shape != other.shape:
+            raise ValueError(f"Inconsistent shapes: {self.shape} and {other.shape}")
+
+    def __add__(self, other: "BitMatrix") -> "BitMatrix":
+        self._check_shape(other)
+        return BitMatrix(self.shape, self.words | other.words)
+
+    def __radd__(self, other) -> "BitMatrix":
+        # allows builtin sum() over BitMatrix values
+        if isinstance(other, int) and other == 0:
+            return self.copy()
+        return self.__add__(other)
+
+    def __iadd__(self, other: "BitMatrix") -> "BitMatrix":
+        self._check_shape(other)
+        self.words |= other.words
+        return self
+
+    __or__ = __add__
+    __ior__ = __iadd__
+
+    def __sub__(self, other: "BitMatrix") -> "BitMatrix":
+        """
+        Elements of self which are not present in other
+        """
+        self._check_shape(other)
+        return BitMatrix(self.shape, self.words & ~other.words)
+
+    def multiply(self, other: "BitMatrix") -> "BitMatrix":
+        """
+        Element-wise conjunction of two matrices
+        """
+        self._check_shape(other)
+        return BitMatrix(self.shape, self.words & other.words)
+
+    def __matmul__(self, other: "BitMatrix") -> "BitMatrix":
+        """
+        Boolean matrix multiplication by the Method of Four Russians.
+        Rows of other are taken in groups of 8, all 256 disjunctions of each group
+        are tabulated and every row of self picks its disjunction by one byte lookup.
+        """
+        if self.shape[1] != other.shape[0]:
+            raise ValueError(
+                f"Inconsistent shapes for multiplication: {self.shape} and {other.shape}"
+            )
+
+        result = BitMatrix((self.shape[0], other.shape[1]))
+        if self.shape[0] == 0 or other.shape[1] == 0:
+            return result
+
+        lhs_bytes = self.words.astype("<u8", copy=False).view(np.uint8)
+        table = np.zeros((1 << _CHUNK_SIZE, other.words.shape[1]), dtype=np.uint64)
+
+        for chunk in range((self.shape[1] + _CHUNK_SIZE - 1) // _CHUNK_SIZE):
+            selectors = lhs_bytes[:, chunk]
+            active_rows = np.flatnonzero(selectors)
+            if active_rows.size == 0:
+                continue
+
+            first_row = chunk * _CHUNK_SIZE
+            for bit, row in enumerate(
+                range(first_row, min(first_row + _CHUNK_SIZE, other.shape[0]))
+            ):
+                np.bitwise_or(
+                    table[: 1 << bit],
+                    other.words[row],
+                    out=table[1 << bit : 1 << (bit + 1)],
+                )
+
+            result.words[active_rows] |= table[selectors[active_rows]]
+
+        return result
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, BitMatrix):
+            return NotImplemented
+        return self.shape == other.shape and np.array_equal(self.words, other.words)
+
+    def __repr__(self):
+        return f"BitMatrix(shape={self.shape}, nnz={self.nnz})"
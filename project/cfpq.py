@@ -1,13 +1,65 @@
-from typing import Set, Tuple
+import time
+from collections import namedtuple
+from itertools import islice
+from typing import Set, Tuple, Union
 
 import networkx as nx
+import numpy as np
 from pyformlang.cfg import CFG, Variable
 
-from project import hellings, matrix, tensor
+from project import hellings, matrix, tensor, gll
 
-from project.cfpq_algorithms import hellings, matrix, tensor
+from project.cfpq_algorithms import hellings, matrix, tensor, gll, gll_descriptors
+from project.ecfg_utils import convert_cfg_to_ecfg
+from project.graph_index import GraphIndex, as_graph_index
+from project.matrix import SPARSE_BACKEND, BITPACKED_BACKEND
+from project.multiple_source_cfpq import MultipleSourceCfpq
+from project.rsm_utils import convert_ecfg_to_rsm
+from project.wcnf_utils import convert_cfg_to_wcnf
 
-__all__ = ["hellings_cfpq", "matrix_cfpq", "tensor_cfpq"]
+__all__ = [
+    "hellings_cfpq",
+    "matrix_cfpq",
+    "tensor_cfpq",
+    "gll_cfpq",
+    "multiple_source_cfpq",
+    "CfpqPlan",
+    "plan_cfpq",
+    "cfpq",
+    "HELLINGS_ALGORITHM",
+    "MATRIX_ALGORITHM",
+    "TENSOR_ALGORITHM",
+    "GLL_ALGORITHM",
+    "MULTIPLE_SOURCE_ALGORITHM",
+]
+
+HELLINGS_ALGORITHM = "hellings"
+MATRIX_ALGORITHM = "matrix"
+TENSOR_ALGORITHM = "tensor"
+GLL_ALGORITHM = "gll"
+MULTIPLE_SOURCE_ALGORITHM = "multiple-source"
+
+CfpqPlan = namedtuple("CfpqPlan", ["algorithm", "backend", "estimates", "statistics"])
+
+# sampled sources, GLL walk is stopped after _SAMPLE_DESCRIPTORS descriptors,
+# semi-naive probe after _PROBE_ROUNDS rounds and then it is assumed
+# that evaluation takes _UNFINISHED_PROBE_FACTOR times more rounds
+_SAMPLE_SIZE = 8
+_PROBE_SIZE = 2
+_SAMPLE_DESCRIPTORS = 20_000
+_PROBE_ROUNDS = 64
+_UNFINISHED_PROBE_FACTOR = 8
+
+# costs in seconds calibrated on random and two-cycles graphs
+_FACT_COST = 3e-5  # derived fact or graph element processed by Python code
+_JOIN_COST = 1e-6  # fact matched with adjacent fact by Python code
+_OUTPUT_COST = 6e-6  # fact of all-pairs result converted to triple
+_CALL_COST = 5e-4  # sparse matrix operation
+_ROW_COST = 3e-7  # matrix row in sparse matrix operation
+_FLOP_COST = 1.5e-8  # entries product in sparse matrix multiplication
+_CHUNK_COST = 2e-4  # group of 8 rows in bitpacked multiplication
+_WORD_COST = 1e-9  # 64-bit word operation in bitpacked multiplication
+_BITPACKED_MEMORY = 1 << 30
 
 
 def _cfpq(
@@ -15,7 +67,9 @@ def _cfpq(
     cfg: CFG,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
-) -> Set[Tuple[int, int]]:
+    limit: int = None,
+    exists_only: bool = False,
+) -> Union[Set[Tuple[int, int]], bool]:
     """
     Internal function for CFPQ
 
@@ -29,10 +83,14 @@ def _cfpq(
         set of start nodes in given graph
     final_nodes: Set[int]
         set of final nodes in given graph
+    limit: int
+        maximal count of returned pairs
+    exists_only: bool
+        return only whether the result is not empty
 
     Returns
     -------
-    Set[Tuple[int, int]]:
+    Set[Tuple[int, int]] | bool:
         set of tuples (node, node)
     """
     reach_pairs = {(u, v) for u, h, v in algorithm_result if h == cfg.start_symbol}
@@ -41,23 +99,43 @@ def _cfpq(
     if final_nodes:
         reach_pairs = {(u, v) for u, v in reach_pairs if v in final_nodes}
 
+    if exists_only:
+        return bool(reach_pairs)
+    if limit is not None:
+        return set(islice(reach_pairs, limit))
     return reach_pairs
 
 
+def _result_limit(limit: int = None, exists_only: bool = False):
+    """
+    Count of answers sufficient for the algorithm to stop
+
+    Raises
+    ------
+    ValueError
+        If limit is negative
+    """
+    if limit is not None and limit < 0:
+        raise ValueError("Limit must be non-negative")
+    return 1 if exists_only else limit
+
+
 def hellings_cfpq(
-    graph: nx.MultiDiGraph,
+    graph: Union[nx.MultiDiGraph, GraphIndex],
     cfg: CFG,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
     start_var: Variable = Variable("S"),
-) -> Set[Tuple[int, int]]:
+    limit: int = None,
+    exists_only: bool = False,
+) -> Union[Set[Tuple[int, int]], bool]:
     """
     Context-Free Path Querying based on Hellings Algorithm
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
     cfg: CFG
         input CFG
     start_nodes: Set[int]
@@ -66,31 +144,53 @@ def hellings_cfpq(
         set of final nodes in given graph
     start_var: Variable
         start variable in CFG
+    limit: int, default=None
+        maximal count of returned pairs, evaluation stops
+        as soon as this count of pairs is found
+    exists_only: bool, default=False
+        return only whether the result is not empty,
+        evaluation stops at the first pair found
 
     Returns
     -------
-    Set[Tuple[int, int]]:
-        set of tuples (node, node)
+    Set[Tuple[int, int]] | bool:
+        set of tuples (node, node), or bool if exists_only
+
+    Raises
+    ------
+    ValueError
+        If limit is negative
     """
     cfg._start_symbol = start_var
+    result_limit = _result_limit(limit, exists_only)
 
-    return _cfpq(set(hellings(graph, cfg)), cfg, start_nodes, final_nodes)
+    return _cfpq(
+        set(hellings(graph, cfg, result_limit, start_nodes, final_nodes)),
+        cfg,
+        start_nodes,
+        final_nodes,
+        limit,
+        exists_only,
+    )
 
 
 def matrix_cfpq(
-    graph: nx.MultiDiGraph,
+    graph: Union[nx.MultiDiGraph, GraphIndex],
     cfg: CFG,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
     start_variable: Variable = Variable("S"),
-) -> Set[Tuple[int, int]]:
+    backend: str = SPARSE_BACKEND,
+    limit: int = None,
+    exists_only: bool = False,
+) -> Union[Set[Tuple[int, int]], bool]:
     """
     Context-Free Path Querying based on matrix multiplication
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
     cfg: CFG
         input CFG
     start_nodes: Set[int]
@@ -99,31 +199,54 @@ def matrix_cfpq(
         set of final nodes in given graph
     start_variable: Variable
         start variable in CFG
+    backend: str
+        representation of boolean matrices (SPARSE_BACKEND or BITPACKED_BACKEND)
+    limit: int, default=None
+        maximal count of returned pairs, evaluation stops
+        as soon as this count of pairs is found
+    exists_only: bool, default=False
+        return only whether the result is not empty,
+        evaluation stops at the first pair found
 
     Returns
     -------
-    Set[Tuple[int, int]]:
-        set of tuples (node, node)
+    Set[Tuple[int, int]] | bool:
+        set of tuples (node, node), or bool if exists_only
+
+    Raises
+    ------
+    ValueError
+        If limit is negative
     """
     cfg._start_symbol = start_variable
+    result_limit = _result_limit(limit, exists_only)
 
-    return _cfpq(set(matrix(graph, cfg)), cfg, start_nodes, final_nodes)
+    return _cfpq(
+        set(matrix(graph, cfg, backend, result_limit, start_nodes, final_nodes)),
+        cfg,
+        start_nodes,
+        final_nodes,
+        limit,
+        exists_only,
+    )
 
 
 def tensor_cfpq(
-    graph: nx.MultiDiGraph,
+    graph: Union[nx.MultiDiGraph, GraphIndex],
     cfg: CFG,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
     start_variable: Variable = Variable("S"),
-) -> Set[Tuple[int, int]]:
+    limit: int = None,
+    exists_only: bool = False,
+) -> Union[Set[Tuple[int, int]], bool]:
     """
     Context-Free Path Querying based on tensor algorithm and RSM
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
     cfg: CFG
         input CFG
     start_nodes: Set[int]
@@ -132,12 +255,383 @@ def tensor_cfpq(
         set of final nodes in given graph
     start_variable: Variable
         start variable in CFG
+    limit: int, default=None
+        maximal count of returned pairs, evaluation stops
+        as soon as this count of pairs is found
+    exists_only: bool, default=False
+        return only whether the result is not empty,
+        evaluation stops at the first pair found
 
     Returns
     -------
-    Set[Tuple[int, int]]:
-        set of tuples (node, node)
+    Set[Tuple[int, int]] | bool:
+        set of tuples (node, node), or bool if exists_only
+
+    Raises
+    ------
+    ValueError
+        If limit is negative
     """
     cfg._start_symbol = start_variable
+    result_limit = _result_limit(limit, exists_only)
+
+    return _cfpq(
+        set(tensor(graph, cfg, result_limit, start_nodes, final_nodes)),
+        cfg,
+        start_nodes,
+        final_nodes,
+        limit,
+        exists_only,
+    )
+
+
+def gll_cfpq(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    cfg: CFG,
+    start_nodes: Set[int] = None,
+    final_nodes: Set[int] = None,
+    start_variable: Variable = Variable("S"),
+    limit: int = None,
+    exists_only: bool = False,
+) -> Union[Set[Tuple[int, int]], bool]:
+    """
+    Context-Free Path Querying based on GLL algorithm and RSM,
+    only the part of graph reachable from start_nodes is visited
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
+    cfg: CFG
+        input CFG
+    start_nodes: Set[int]
+        set of start nodes in given graph
+    final_nodes: Set[int]
+        set of final nodes in given graph
+    start_variable: Variable
+        start variable in CFG
+    limit: int, default=None
+        maximal count of returned pairs, evaluation stops
+        as soon as this count of pairs is found
+    exists_only: bool, default=False
+        return only whether the result is not empty,
+        evaluation stops at the first pair found
+
+    Returns
+    -------
+    Set[Tuple[int, int]] | bool:
+        set of tuples (node, node), or bool if exists_only
+
+    Raises
+    ------
+    ValueError
+        If limit is negative or start node does not present in the graph
+    """
+    cfg._start_symbol = start_variable
+    result_limit = _result_limit(limit, exists_only)
+
+    return _cfpq(
+        set(gll(graph, cfg, result_limit, start_nodes or None, final_nodes)),
+        cfg,
+        start_nodes,
+        final_nodes,
+        limit,
+        exists_only,
+    )
+
+
+def multiple_source_cfpq(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    cfg: CFG,
+    start_nodes: Set[int] = None,
+    final_nodes: Set[int] = None,
+    start_variable: Variable = Variable("S"),
+    limit: int = None,
+    exists_only: bool = False,
+) -> Union[Set[Tuple[int, int]], bool]:
+    """
+    Context-Free Path Querying based on matrix multiplication,
+    only facts needed for derivations from start_nodes are computed
+    (see MultipleSourceCfpq)
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
+    cfg: CFG
+        input CFG
+    start_nodes: Set[int]
+        set of start nodes in given graph
+    final_nodes: Set[int]
+        set of final nodes in given graph
+    start_variable: Variable
+        start variable in CFG
+    limit: int, default=None
+        maximal count of returned pairs
+    exists_only: bool, default=False
+        return only whether the result is not empty
+
+    Returns
+    -------
+    Set[Tuple[int, int]] | bool:
+        set of tuples (node, node), or bool if exists_only
+
+    Raises
+    ------
+    ValueError
+        If limit is negative or node does not present in the graph
+    """
+    _result_limit(limit, exists_only)
+
+    reach_pairs = MultipleSourceCfpq(graph, cfg, start_variable).query(
+        start_nodes or graph.nodes, final_nodes or None
+    )
+    if exists_only:
+        return bool(reach_pairs)
+    if limit is not None:
+        return set(islice(reach_pairs, limit))
+    return reach_pairs
+
+
+def plan_cfpq(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    cfg: CFG,
+    start_nodes: Set[int] = None,
+    final_nodes: Set[int] = None,
+    start_variable: Variable = Variable("S"),
+) -> CfpqPlan:
+    """
+    Chooses CFPQ algorithm and representation of matrices by estimated cost.
+    Collected statistics are sizes of the part of graph labeled by terminals
+    of grammar, sizes of grammar in WCNF and of its RSM, count of start nodes,
+    and measurements from a few sampled start nodes: descriptors of GLL walk
+    (stopped after a fixed count) and rounds and facts of semi-naive
+    multiple-source evaluation (stopped after a fixed count of rounds).
+    Facts of all nodes and products of matrices are extrapolated from samples.
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
+    cfg: CFG
+        input CFG
+    start_nodes: Set[int]
+        set of start nodes in given graph
+    final_nodes: Set[int]
+        set of final nodes in given graph
+    start_variable: Variable
+        start variable in CFG
+
+    Returns
+    -------
+    CfpqPlan:
+        algorithm and backend (None for hellings, tensor, gll
+        and multiple-source) of the cheapest plan,
+        estimates: estimated time in seconds for every (algorithm, backend),
+        statistics: collected statistics
+
+    Raises
+    ------
+    ValueError
+        If node does not present in the graph
+    """
+    graph_index = as_graph_index(graph)
+    for node in (start_nodes or set()) | (final_nodes or set()):
+        if node not in graph_index:
+            raise ValueError(f"\nNode {node} does not present in the graph")
+
+    cfg = CFG(start_symbol=start_variable, productions=cfg.productions)
+    wcnf = convert_cfg_to_wcnf(cfg)
+    rsm = convert_ecfg_to_rsm(convert_cfg_to_ecfg(cfg)).minimize()
+    terminals = {t.value for t in wcnf.terminals}
+    relevant = graph_index.restrict(terminals)
+    n, m = relevant.number_of_nodes, relevant.number_of_edges
+    binary = [p for p in wcnf.productions if len(p.body) == 2]
+
+    candidates = [
+        node for node in (start_nodes or graph_index.nodes) if node in relevant
+    ]
+    sample = sorted(
+        np.random.default_rng(0)
+        .choice(len(candidates), min(_SAMPLE_SIZE, len(candidates)), replace=False)
+        .tolist()
+    )
+    sample = [candidates[i] for i in sample]
+
+    statistics = {
+        "nodes": n,
+        "edges": m,
+        "labels": len(terminals & relevant.labels),
+        "variables": len(wcnf.variables),
+        "binary_productions": len(binary),
+        "rsm_states": sum(len(box.dfa.states) for box in rsm.boxes),
+        "sources": len(candidates),
+        "sampled_sources": len(sample),
+    }
+
+    # GLL walk from sampled sources measures the cost of on-demand evaluation
+    elapsed = time.perf_counter()
+    descriptors = gll_descriptors(
+        relevant, rsm, sample, max_descriptors=_SAMPLE_DESCRIPTORS
+    )
+    elapsed = time.perf_counter() - elapsed
+    gll_complete = descriptors < _SAMPLE_DESCRIPTORS
+    statistics.update(sample_descriptors=descriptors, sample_complete=gll_complete)
+
+    def sampled(value):
+        return value * len(candidates) / max(len(sample), 1)
+
+    def sparse_round():
+        return len(binary) * (_CALL_COST + _ROW_COST * n)
+
+    # probe is skipped if GLL is surely cheaper than one round of matrix algorithm
+    probe = None
+    if not (gll_complete and sampled(elapsed) < sparse_round()):
+        probe_sample = sample[:_PROBE_SIZE]
+        engine = MultipleSourceCfpq(relevant, cfg, start_variable)
+        rounds, probe_complete, probe_facts = engine.probe(probe_sample, _PROBE_ROUNDS)
+        row_facts = {
+            variable: count / max(len(probe_sample), 1)
+            for variable, count in probe_facts.items()
+        }
+        probe = (rounds, probe_complete, row_facts)
+        statistics.update(probe_rounds=rounds, probe_complete=probe_complete)
+
+    if probe is None:
+        rounds, row_facts = 1, {}
+    else:
+        rounds, probe_complete, row_facts = probe
+        if not probe_complete:
+            rounds *= _UNFINISHED_PROBE_FACTOR
+    facts = n * sum(row_facts.values())
+    flops = n * sum(
+        row_facts.get(p.body[0].value, 0) * row_facts.get(p.body[1].value, 0)
+        for p in binary
+    )
+    statistics.update(facts=facts, flops=flops)
+
+    estimates = {
+        (HELLINGS_ALGORITHM, None): _FACT_COST * (n + m + facts) + _JOIN_COST * flops,
+        (MATRIX_ALGORITHM, SPARSE_BACKEND): rounds * sparse_round()
+        + _FLOP_COST * flops
+        + _OUTPUT_COST * facts,
+        # every round of tensor inserts nonterminal edges into the closure,
+        # add_closure_edges makes about ten sparse operations per iteration
+        # and usually two iterations, so 20 operations per box are counted
+        (TENSOR_ALGORITHM, None): rounds
+        * len(rsm.boxes)
+        * (_CALL_COST * 20 + _ROW_COST * statistics["rsm_states"] * n)
+        + _FLOP_COST * flops * statistics["rsm_states"]
+        + _OUTPUT_COST * facts,
+        # the probe is a run of multiple-source evaluation, so it makes
+        # the same rounds, but only facts at rows of start nodes are derived
+        (MULTIPLE_SOURCE_ALGORITHM, None): rounds * sparse_round()
+        + (_FLOP_COST * flops + _OUTPUT_COST * facts) * len(candidates) / max(n, 1),
+        (GLL_ALGORITHM, None): (
+            sampled(elapsed)
+            if gll_complete
+            else _FACT_COST * statistics["rsm_states"] / 2 * (n + m + facts)
+        ),
+    }
+    if len(wcnf.variables) * n * n / 8 <= _BITPACKED_MEMORY:
+        estimates[(MATRIX_ALGORITHM, BITPACKED_BACKEND)] = (
+            rounds * len(binary) * (n / 8 * _CHUNK_COST + n ** 3 / 512 * _WORD_COST)
+            + _OUTPUT_COST * facts
+        )
+
+    algorithm, backend = min(estimates, key=estimates.get)
+    return CfpqPlan(algorithm, backend, estimates, statistics)
+
+
+def cfpq(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    cfg: CFG,
+    start_nodes: Set[int] = None,
+    final_nodes: Set[int] = None,
+    start_variable: Variable = Variable("S"),
+    limit: int = None,
+    exists_only: bool = False,
+    plan: CfpqPlan = None,
+) -> Union[Set[Tuple[int, int]], bool]:
+    """
+    Context-Free Path Querying by the algorithm chosen by plan_cfpq
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
+    cfg: CFG
+        input CFG
+    start_nodes: Set[int]
+        set of start nodes in given graph
+    final_nodes: Set[int]
+        set of final nodes in given graph
+    start_variable: Variable
+        start variable in CFG
+    limit: int, default=None
+        maximal count of returned pairs, evaluation stops
+        as soon as this count of pairs is found
+    exists_only: bool, default=False
+        return only whether the result is not empty,
+        evaluation stops at the first pair found
+    plan: CfpqPlan, default=None
+        plan to execute, made by plan_cfpq if not specified
+
+    Returns
+    -------
+    Set[Tuple[int, int]] | bool:
+        set of tuples (node, node), or bool if exists_only
+
+    Raises
+    ------
+    ValueError
+        If limit is negative, node does not present in the graph
+        or algorithm of plan is unknown
+    """
+    graph_index = as_graph_index(graph)
+    if plan is None:
+        plan = plan_cfpq(graph_index, cfg, start_nodes, final_nodes, start_variable)
 
-    return _cfpq(set(tensor(graph, cfg)), cfg, start_nodes, final_nodes)
+    arguments = dict(start_nodes=start_nodes, final_nodes=final_nodes, limit=limit)
+    if plan.algorithm == HELLINGS_ALGORITHM:
+        return hellings_cfpq(
+            graph_index,
+            cfg,
+            start_var=start_variable,
+            exists_only=exists_only,
+            **arguments,
+        )
+    if plan.algorithm == MATRIX_ALGORITHM:
+        return matrix_cfpq(
+            graph_index,
+            cfg,
+            start_variable=start_variable,
+            backend=plan.backend,
+            exists_only=exists_only,
+            **arguments,
+        )
+    if plan.algorithm == TENSOR_ALGORITHM:
+        return tensor_cfpq(
+            graph_index,
+            cfg,
+            start_variable=start_variable,
+            exists_only=exists_only,
+            **arguments,
+        )
+    if plan.algorithm == GLL_ALGORITHM:
+        return gll_cfpq(
+            graph_index,
+            cfg,
+            start_variable=start_variable,
+            exists_only=exists_only,
+            **arguments,
+        )
+    if plan.algorithm == MULTIPLE_SOURCE_ALGORITHM:
+        return multiple_source_cfpq(
+            graph_index,
+            cfg,
+            start_variable=start_variable,
+            exists_only=exists_only,
+            **arguments,
+        )
+    raise ValueError(f"\nUnknown CFPQ algorithm {plan.algorithm}")
@@ -1,228 +1,687 @@
-from typing import Tuple, Set
+from collections import defaultdict, deque
+from typing import List, Optional, Tuple, Set, Union
 
 import networkx as nx
-from pyformlang.cfg import CFG
+import numpy as np
+from pyformlang.cfg import CFG, Variable
 from scipy import sparse
-from scipy.sparse import dok_matrix, identity
 
 from project import (
     convert_cfg_to_wcnf,
-    get_nfa_by_graph,
     BooleanMatrices,
+    convert_cfg_to_ecfg,
+    convert_ecfg_to_rsm,
+    RSM,
     intersect_boolean_matrices,
+    SPARSE_BACKEND,
+    convert_matrix,
+    identity_matrix,
+    new_elements,
+    add_closure_edges,
+    GraphIndex,
+    as_graph_index,
 )
 
-__all__ = ["hellings", "matrix", "tensor"]
+__all__ = ["hellings", "matrix", "tensor", "gll", "gll_descriptors"]
 
 
-def hellings(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
+def _decode_triples(
+    graph_index: GraphIndex, triples: Set[Tuple[int, str, int]]
+) -> Set[Tuple[int, str, int]]:
     """
+    Replaces node indices in triples with the nodes of graph
+    """
+    return {
+        (graph_index.nodes[u], variable, graph_index.nodes[v])
+        for u, variable, v in triples
+    }
+
 
+class _AnswersLimit:
+    """
+    Counts pairs (start node, final node) derived from the start variable,
+    algorithms stop as soon as the count reaches the limit
+    """
+
+    def __init__(
+        self,
+        graph_index: GraphIndex,
+        cfg: CFG,
+        limit: int,
+        start_nodes: Set = None,
+        final_nodes: Set = None,
+    ):
+        start_symbol = cfg.start_symbol
+        self.variable = (
+            start_symbol.value if isinstance(start_symbol, Variable) else start_symbol
+        )
+        self.limit = limit
+        self.start_mask = self._mask(graph_index, start_nodes)
+        self.final_mask = self._mask(graph_index, final_nodes)
+
+    @staticmethod
+    def _mask(graph_index: GraphIndex, nodes: Set = None) -> np.ndarray:
+        if not nodes:
+            return np.ones(graph_index.number_of_nodes, dtype=bool)
+        mask = np.zeros(graph_index.number_of_nodes, dtype=bool)
+        mask[[graph_index.node_indices[n] for n in nodes if n in graph_index]] = True
+        return mask
+
+    def is_answer(self, u: int, variable: str, v: int) -> bool:
+        return variable == self.variable and self.start_mask[u] and self.final_mask[v]
+
+    def count_matrix(self, variable_matrix) -> int:
+        pairs = sparse.coo_matrix(convert_matrix(variable_matrix, SPARSE_BACKEND))
+        return int(
+            np.count_nonzero(
+                self.start_mask[pairs.row] & self.final_mask[pairs.col] & pairs.data
+            )
+        )
 
+    def count_keys(self, keys: np.ndarray, variable_id: int, n: int) -> int:
+        """
+        Counts answers among edges encoded by keys (variable_id * n + u) * n + v
+        """
+        ids, edges = np.divmod(keys, n * n)
+        u, v = np.divmod(edges[ids == variable_id], n)
+        return int(np.count_nonzero(self.start_mask[u] & self.final_mask[v]))
 
+    def reached(self, count: int) -> bool:
+        return count >= self.limit
 
 
+def _answers_limit(
+    graph_index: GraphIndex,
+    cfg: CFG,
+    limit: int = None,
+    start_nodes: Set = None,
+    final_nodes: Set = None,
+) -> Optional[_AnswersLimit]:
+    if limit is None:
+        return None
+    return _AnswersLimit(graph_index, cfg, limit, start_nodes, final_nodes)
 
-    Hellings algorithm for solving Context-Free Path Querying problem
+
+def _grammar_strata(wcnf: CFG) -> List[Set[str]]:
+    """
+    Splits variables of grammar in WCNF into strongly connected components
+    of their dependency graph (head depends on both body variables),
+    components are listed so that dependencies go first
+    """
+    dependencies = nx.DiGraph()
+    dependencies.add_nodes_from(v.value for v in wcnf.variables)
+    for p in wcnf.productions:
+        if len(p.body) == 2:
+            dependencies.add_edge(p.body[0].value, p.head.value)
+            dependencies.add_edge(p.body[1].value, p.head.value)
+
+    condensation = nx.condensation(dependencies)
+    return [
+        set(condensation.nodes[component]["members"])
+        for component in nx.topological_sort(condensation)
+    ]
+
+
+def hellings(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    cfg: CFG,
+    limit: int = None,
+    start_nodes: Set = None,
+    final_nodes: Set = None,
+) -> Set[Tuple[int, str, int]]:
+    """
+    Hellings algorithm for solving Context-Free Path Querying problem.
+    Derived triples are indexed by their ends and nonterminal, binary productions
+    by both body symbols, so every new triple is joined only with adjacent
+    triples that appear together with it in some production body.
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
     cfg: CFG
         input cfg
+    limit: int, default=None
+        stop as soon as this count of pairs between start_nodes and final_nodes
+        is derived from the start symbol, result is incomplete then
+    start_nodes: Set, default=None
+        start nodes counted for limit, all nodes if not specified
+    final_nodes: Set, default=None
+        final nodes counted for limit, all nodes if not specified
 
     Returns
     -------
     set[Tuple[int, str, int]]:
         set tuples (node, terminal, node)
     """
+    graph_index = as_graph_index(graph)
     wcnf = convert_cfg_to_wcnf(cfg)
+    answers = _answers_limit(graph_index, cfg, limit, start_nodes, final_nodes)
 
     eps_prod_heads = [p.head.value for p in wcnf.productions if not p.body]
-    term_productions = {p for p in wcnf.productions if len(p.body) == 1}
-    var_productions = {p for p in wcnf.productions if len(p.body) == 2}
-
-    r = {(v, h, v) for v in range(graph.number_of_nodes()) for h in eps_prod_heads} | {
-        (u, p.head.value, v)
-        for u, v, edge_data in graph.edges(data=True)
-        for p in term_productions
-        if p.body[0].value == edge_data["label"]
-    }
-
-    new = r.copy()
-    while new:
-        n, N, m = new.pop()
-        r_temp = set()
-
-        for u, M, v in r:
-            if v == n:
-                triplets = {
-                    (u, p.head.value, m)
-                    for p in var_productions
-                    if p.body[0].value == M
-                    and p.body[1].value == N
-                    and (u, p.head.value, m) not in r
-                }
-                new |= triplets
-                r_temp |= triplets
-        r |= r_temp
-        r_temp.clear()
-
-        for u, M, v in r:
-            if u == m:
-                triplets = {
-                    (n, p.head.value, v)
-                    for p in var_productions
-                    if p.body[0].value == N
-                    and p.body[1].value == M
-                    and (n, p.head.value, v) not in r
-                }
-                new |= triplets
-                r_temp |= triplets
-        r |= r_temp
-
-    return r
-
-
-def matrix(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
+    term_heads = defaultdict(list)
+    by_left, by_right = defaultdict(list), defaultdict(list)
+    for p in wcnf.productions:
+        if len(p.body) == 1:
+            term_heads[p.body[0].value].append(p.head.value)
+        elif len(p.body) == 2:
+            left, right = p.body[0].value, p.body[1].value
+            by_left[left].append((p.head.value, right))
+            by_right[right].append((p.head.value, left))
+
+    # outgoing[u][A] holds v and incoming[v][A] holds u for every derived (u, A, v)
+    outgoing = defaultdict(lambda: defaultdict(set))
+    incoming = defaultdict(lambda: defaultdict(set))
+    new = deque()
+    found = 0
+
+    def add(u, variable, v):
+        nonlocal found
+        if v in outgoing[u][variable]:
+            return
+        outgoing[u][variable].add(v)
+        incoming[v][variable].add(u)
+        new.append((u, variable, v))
+        if answers and answers.is_answer(u, variable, v):
+            found += 1
+
+    for v in range(graph_index.number_of_nodes):
+        for h in eps_prod_heads:
+            add(v, h, v)
+    for u, label, v in graph_index.edges():
+        for h in term_heads.get(label, ()):
+            add(u, h, v)
+
+    while new and not (answers and answers.reached(found)):
+        n, N, m = new.popleft()
+        # (u, M, n) (n, N, m) -> (u, head, m)
+        for head, left in by_right.get(N, ()):
+            for u in list(incoming[n].get(left, ())):
+                add(u, head, m)
+        # (n, N, m) (m, M, v) -> (n, head, v)
+        for head, right in by_left.get(N, ()):
+            for v in list(outgoing[m].get(right, ())):
+                add(n, head, v)
+
+    return _decode_triples(
+        graph_index,
+        {
+            (u, variable, v)
+            for u, by_variable in outgoing.items()
+            for variable, nodes_to in by_variable.items()
+            for v in nodes_to
+        },
+    )
+
+
+def matrix(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    cfg: CFG,
+    backend: str = SPARSE_BACKEND,
+    limit: int = None,
+    start_nodes: Set = None,
+    final_nodes: Set = None,
+) -> Set[Tuple[int, str, int]]:
     """
     Matrix algorithm for solving Context-Free Path Querying problem
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
     cfg: CFG
         input cfg
+    limit: int, default=None
+        stop as soon as this count of pairs between start_nodes and final_nodes
+        is derived from the start symbol, result is incomplete then
+    start_nodes: Set, default=None
+        start nodes counted for limit, all nodes if not specified
+    final_nodes: Set, default=None
+        final nodes counted for limit, all nodes if not specified
 
     Returns
     -------
     set[Tuple[int, str, int]]:
         set tuples (node, terminal, node)
     """
+    graph_index = as_graph_index(graph)
     wcnf = convert_cfg_to_wcnf(cfg)
+    answers = _answers_limit(graph_index, cfg, limit, start_nodes, final_nodes)
 
-    num_of_nodes = graph.number_of_nodes()
+    num_of_nodes = graph_index.number_of_nodes
     matrices = {
-        v.value: sparse.dok_matrix((num_of_nodes, num_of_nodes), dtype=bool)
+        v.value: sparse.csr_matrix((num_of_nodes, num_of_nodes), dtype=bool)
         for v in wcnf.variables
     }
 
     term_productions = {p for p in wcnf.productions if len(p.body) == 1}
-    for i, j, data in graph.edges(data=True):
-        l = data["label"]
-        for v in {p.head.value for p in term_productions if p.body[0].value == l}:
-            matrices[v][i, j] = True
-
-    eps_products_heads = [p.head.value for p in wcnf.productions if not p.body]
-    for i in range(num_of_nodes):
-        for v in eps_products_heads:
-            matrices[v][i, i] = True
-
-    changed = True
-    variable_productions = {p for p in wcnf.productions if len(p.body) == 2}
-    while changed:
-        changed = False
-        for p in variable_productions:
-            old_nnz = matrices[p.head.value].nnz
-            matrices[p.head.value] += (
-                matrices[p.body[0].value] @ matrices[p.body[1].value]
-            )
-            new_nnz = matrices[p.head.value].nnz
-            changed = changed or old_nnz != new_nnz
+    for p in term_productions:
+        label_matrix = graph_index.csr_matrices.get(p.body[0].value)
+        if label_matrix is not None:
+            matrices[p.head.value] = matrices[p.head.value] + label_matrix
 
-    return {
-        (u, variable, v)
-        for variable, var_matrix in matrices.items()
-        for u, v in zip(*var_matrix.nonzero())
-    }
+    eps_products_heads = {p.head.value for p in wcnf.productions if not p.body}
+    for v in eps_products_heads:
+        matrices[v] = matrices[v] + sparse.identity(
+            num_of_nodes, dtype=bool, format="csr"
+        )
 
+    matrices = {v: convert_matrix(m, backend) for v, m in matrices.items()}
 
-def tensor(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
+    # productions with the same body share one product
+    heads_by_body = defaultdict(set)
+    for p in wcnf.productions:
+        if len(p.body) == 2:
+            heads_by_body[(p.body[0].value, p.body[1].value)].add(p.head.value)
+
+    def limit_reached():
+        return (
+            answers is not None
+            and answers.variable in matrices
+            and answers.reached(answers.count_matrix(matrices[answers.variable]))
+        )
+
+    # strata are evaluated in dependency order, every one to its fixpoint.
+    # Inside a stratum evaluation is semi-naive: only products with an entry
+    # found in the previous round are computed, dA = dB @ C + B @ dC without
+    # entries of A. Matrices are replaced, not updated, so deltas may share them
+    for stratum in _grammar_strata(wcnf):
+        bodies = {
+            body: heads & stratum
+            for body, heads in heads_by_body.items()
+            if heads & stratum
+        }
+        used = stratum.union(*bodies.keys())
+        deltas = {v: matrices[v] for v in used if matrices[v].nnz}
+        while bodies and deltas:
+            if limit_reached():
+                break
+
+            candidates = dict()
+            for (left, right), heads in bodies.items():
+                products = []
+                if left in deltas:
+                    products.append(deltas[left] @ matrices[right])
+                if right in deltas:
+                    products.append(matrices[left] @ deltas[right])
+                if not products:
+                    continue
+                product = sum(products[1:], products[0])
+                for head in heads:
+                    candidates[head] = (
+                        product
+                        if head not in candidates
+                        else candidates[head] + product
+                    )
+
+            deltas = dict()
+            for v, candidate in candidates.items():
+                delta = new_elements(candidate, matrices[v])
+                if delta.nnz:
+                    deltas[v] = delta
+            for v, delta in deltas.items():
+                matrices[v] = matrices[v] + delta
+
+        if limit_reached():
+            break
+
+    return _decode_triples(
+        graph_index,
+        {
+            (u, variable, v)
+            for variable, var_matrix in matrices.items()
+            for u, v in zip(*var_matrix.nonzero())
+        },
+    )
+
+
+def tensor(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    cfg: CFG,
+    limit: int = None,
+    start_nodes: Set = None,
+    final_nodes: Set = None,
+) -> Set[Tuple[int, str, int]]:
     """
     Tensor algorithm for solving Context-Free Path Querying problem
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
     cfg: CFG
         input cfg
+    limit: int, default=None
+        stop as soon as this count of pairs between start_nodes and final_nodes
+        is derived from the start symbol, result is incomplete then
+    start_nodes: Set, default=None
+        start nodes counted for limit, all nodes if not specified
+    final_nodes: Set, default=None
+        final nodes counted for limit, all nodes if not specified
 
     Returns
     -------
     set[Tuple[int, str, int]]:
         set tuples (node, terminal, node)
     """
-    wcnf = convert_cfg_to_wcnf(cfg)
+    # boolean matrices are sparse: the closure is updated by products
+    # of its few columns and rows (see add_closure_edges)
+
+    # one minimal DFA box per variable, its start and final states
+    # are joined by edges labeled with the variable (states_to_box_variable)
+    rsm = convert_ecfg_to_rsm(convert_cfg_to_ecfg(cfg)).minimize()
+    bfa = BooleanMatrices.from_rsm(rsm)
+    bfa.bool_matrices = {
+        label.value: matrix for label, matrix in bfa.bool_matrices.items()
+    }
+    boxes = bfa.bool_matrices
+    rsm_heads = bfa.states_to_box_variable
+    nonterm = {box.variable.value for box in rsm.boxes}
+    n = bfa.states_count
+
+    # nodes without edges labeled by terminals are only reachable
+    # from themselves by empty paths, they are added after the main loop
+    graph_index = as_graph_index(graph, boxes.keys() - nonterm)
+    bm = graph_index.to_boolean_matrices()
+    answers = _answers_limit(graph_index, cfg, limit, start_nodes, final_nodes)
+
+    # empty paths accepted by boxes, other nullable variables
+    # are derived through the closure
+    empty_heads = {
+        variable
+        for (rfa_from, rfa_to), variable in rsm_heads.items()
+        if rfa_from == rfa_to
+    }
+    for variable in empty_heads:
+        bm.bool_matrices[variable] = identity_matrix(bm.states_count)
+
+    # the closure of the product is computed once, then nonterminal edges
+    # found in its new pairs are inserted into it (see add_closure_edges)
+    ng, size = bm.states_count, n * bm.states_count
+    closure = intersect_boolean_matrices(bfa, bm).make_transitive_closure()
+    if closure.shape != (size, size):
+        # no common labels, the product has no edges
+        closure = sparse.csr_matrix((size, size), dtype=bool)
+    closure = delta = sparse.csr_matrix(closure, dtype=bool)
+
+    # nonterminal edges (u, variable, v) are encoded by integer keys
+    # (variable id * ng + u) * ng + v, kept sorted in found_keys
+    variables = sorted(nonterm)
+    variable_ids = {variable: i for i, variable in enumerate(variables)}
+    head_ids = np.full((n, n), -1, dtype=np.int64)
+    for (rfa_from, rfa_to), variable in rsm_heads.items():
+        head_ids[rfa_from, rfa_to] = variable_ids[variable]
+    box_transitions = {
+        variable_ids[variable]: sparse.csr_matrix(boxes[variable]).nonzero()
+        for variable in nonterm & boxes.keys()
+    }
+
+    nodes = np.arange(ng, dtype=np.int64)
+    found_keys = np.unique(
+        np.concatenate(
+            [np.array([], dtype=np.int64)]
+            + [
+                (variable_ids[variable] * ng + nodes) * ng + nodes
+                for variable in empty_heads
+            ]
+        )
+    )
+    answers_found = 0
+    if answers and answers.variable in variable_ids:
+        answer_id = variable_ids[answers.variable]
+        answers_found = answers.count_keys(found_keys, answer_id, ng)
+
+    while delta.nnz and not (answers and answers.reached(answers_found)):
+        pairs = delta.tocoo()
+        ids = head_ids[pairs.row // ng, pairs.col // ng]
+        heads = ids >= 0
+        keys = np.unique(
+            (ids[heads] * ng + pairs.row[heads] % ng) * ng + pairs.col[heads] % ng
+        )
+        new_keys = np.setdiff1d(keys, found_keys, assume_unique=True)
+        if not len(new_keys):
+            break
+        found_keys = np.union1d(found_keys, new_keys)
+        if answers and answers.variable in variable_ids:
+            answers_found += answers.count_keys(new_keys, answer_id, ng)
+
+        ids, edges = np.divmod(new_keys, ng * ng)
+        sources, targets = [], []
+        for variable_id in np.unique(ids):
+            if variable_id not in box_transitions:
+                continue
+            box_from, box_to = box_transitions[variable_id]
+            u, v = np.divmod(edges[ids == variable_id], ng)
+            sources.append((box_from[:, None] * ng + u[None, :]).ravel())
+            targets.append((box_to[:, None] * ng + v[None, :]).ravel())
+
+        if not sources:
+            break
+        closure, delta = add_closure_edges(
+            closure, np.concatenate(sources), np.concatenate(targets)
+        )
+
+    ids, edges = np.divmod(found_keys, ng * ng)
+    triplets = {
+        (u, variables[variable_id], v)
+        for variable_id, u, v in zip(
+            ids.tolist(), (edges // ng).tolist(), (edges % ng).tolist()
+        )
+    }
 
-    n = sum(len(p.body) + 1 for p in wcnf.productions)
-    rsm_heads = dict()
-    nonterm = set()
-    boxes = dict()
-    start_states = set()
-    final_states = set()
-    counter = 0
+    nullable = {s.value for s in cfg.get_nullable_symbols() if s.value in nonterm}
+    return _decode_triples(graph_index, triplets) | {
+        (node, variable, node)
+        for node in graph.nodes
+        if node not in graph_index
+        for variable in nullable
+    }
 
-    nfa_by_graph = get_nfa_by_graph(graph)
-    bm = BooleanMatrices(nfa_by_graph)
 
-    for p in wcnf.productions:
-        nonterm.add(p.head.value)
-        start_states.add(counter)
-        final_states.add(counter + len(p.body))
-        rsm_heads[(counter, counter + len(p.body))] = p.head.value
-        for b in p.body:
-            m = boxes.get(b.value, dok_matrix((n, n), dtype=bool))
-            m[counter, counter + 1] = True
-            boxes[b.value] = m
-            counter += 1
-        counter += 1
+def _gll_walk(
+    graph_index: GraphIndex,
+    rsm: RSM,
+    answers: Optional[_AnswersLimit] = None,
+    sources: List[int] = None,
+    max_descriptors: int = None,
+) -> Tuple[List[Tuple[Tuple[str, int], Set[int]]], int]:
+    """
+    Walks boxes of RSM along the graph from sources (node indices, all nodes
+    if None) calling the start symbol of RSM there. Returns every box call
+    (variable, node index) with node indices where the box finished,
+    and the count of processed descriptors. Walk stops early if answers
+    limit is reached or max_descriptors are processed.
+    """
+    # states of all boxes are numbered together
+    box_starts, final_states = dict(), set()
+    terminal_moves, call_moves = defaultdict(list), defaultdict(list)
+    state_ids = dict()
+
+    def state_id(variable, state):
+        return state_ids.setdefault((variable, state), len(state_ids))
+
+    variables = {box.variable.value for box in rsm.boxes}
+    for box in rsm.boxes:
+        variable = box.variable.value
+        if box.dfa.start_state is None:
+            continue
+        box_starts[variable] = state_id(variable, box.dfa.start_state)
+        final_states.update(state_id(variable, s) for s in box.dfa.final_states)
+        for s_from, label, s_to in box.dfa:
+            moves = call_moves if label.value in variables else terminal_moves
+            moves[state_id(variable, s_from)].append(
+                (label.value, state_id(variable, s_to))
+            )
 
-    for p in wcnf.productions:
-        if len(p.body) == 0:
-            bm.bool_matrices[p.head.value] = identity(
-                bm.states_count, dtype=bool
-            ).todok()
-
-    bfa = BooleanMatrices()
-    bfa.start_states = start_states
-    bfa.final_states = final_states
-    bfa.bool_matrices = boxes
-    bfa.states_count = n
-
-    prev_nnz = -2
-    new_nnz = -1
-    while prev_nnz != new_nnz:
-        transitive_closure = intersect_boolean_matrices(
-            bfa, bm
-        ).make_transitive_closure()
-        prev_nnz, new_nnz = new_nnz, transitive_closure.nnz
-        x, y = transitive_closure.nonzero()
-
-        for (i, j) in zip(x, y):
-            rfa_from = i // bm.states_count
-            rfa_to = j // bm.states_count
-            graph_from = i % bm.states_count
-            graph_to = j % bm.states_count
-
-            if (rfa_from, rfa_to) not in rsm_heads:
+    csr_matrices = graph_index.csr_matrices
+    start_symbol = rsm.start_symbol
+    start_variable = (
+        start_symbol.value if isinstance(start_symbol, Variable) else start_symbol
+    )
+
+    # stack node (variable, node) -> index in stack_calls, stack_edges, popped
+    stack_nodes = dict()
+    stack_calls, stack_edges, popped = [], [], []
+    descriptors = set()
+    stack = []
+    found = 0
+
+    def add(state, node, stack_node):
+        descriptor = (state, node, stack_node)
+        if descriptor not in descriptors:
+            descriptors.add(descriptor)
+            stack.append(descriptor)
+
+    def call(variable, node):
+        if (variable, node) not in stack_nodes:
+            stack_nodes[(variable, node)] = len(stack_calls)
+            stack_calls.append((variable, node))
+            stack_edges.append(set())
+            popped.append(set())
+            add(box_starts[variable], node, stack_nodes[(variable, node)])
+        return stack_nodes[(variable, node)]
+
+    if start_variable in box_starts:
+        if sources is None:
+            sources = range(graph_index.number_of_nodes)
+        for node in sources:
+            call(start_variable, node)
+
+    processed = 0
+    while stack and not (answers and answers.reached(found)):
+        if max_descriptors is not None and processed >= max_descriptors:
+            break
+        processed += 1
+        state, node, stack_node = stack.pop()
+
+        if state in final_states and node not in popped[stack_node]:
+            popped[stack_node].add(node)
+            variable, called_at = stack_calls[stack_node]
+            if answers and answers.is_answer(called_at, variable, node):
+                found += 1
+            for return_state, caller in stack_edges[stack_node]:
+                add(return_state, node, caller)
+
+        for label, next_state in terminal_moves.get(state, ()):
+            matrix = csr_matrices.get(label)
+            if matrix is None:
                 continue
+            for next_node in matrix.indices[
+                matrix.indptr[node] : matrix.indptr[node + 1]
+            ]:
+                add(next_state, int(next_node), stack_node)
 
-            variable = rsm_heads[(rfa_from, rfa_to)]
-            m = bm.bool_matrices.get(
-                variable,
-                dok_matrix((bm.states_count, bm.states_count), dtype=bool),
-            )
-            m[graph_from, graph_to] = True
-            bm.bool_matrices[variable] = m
+        for variable, return_state in call_moves.get(state, ()):
+            if variable not in box_starts:
+                continue
+            callee = call(variable, node)
+            if (return_state, stack_node) not in stack_edges[callee]:
+                stack_edges[callee].add((return_state, stack_node))
+                for returned in list(popped[callee]):
+                    add(return_state, returned, stack_node)
+
+    return list(zip(stack_calls, popped)), processed
+
+
+def gll(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    cfg: CFG,
+    limit: int = None,
+    start_nodes: Set = None,
+    final_nodes: Set = None,
+) -> Set[Tuple[int, str, int]]:
+    """
+    GLL algorithm for solving Context-Free Path Querying problem.
+    Minimal DFA boxes of RSM are walked directly along the graph edges
+    from start nodes. Box call of variable A at node v is a node (A, v)
+    of graph-structured stack, its edges lead to the return states of callers
+    and it keeps nodes where box of A has finished. Descriptors
+    (RSM state, node, stack node) are processed once each,
+    so only the part of graph reachable from start nodes is visited.
 
-    triplets = set()
-    for key, m in bm.bool_matrices.items():
-        if key not in nonterm:
-            continue
-        for (u, v), _ in m.items():
-            triplets.add((u, key, v))
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
+    cfg: CFG
+        input cfg
+    limit: int, default=None
+        stop as soon as this count of pairs between start_nodes and final_nodes
+        is derived from the start symbol, result is incomplete then
+    start_nodes: Set, default=None
+        nodes where paths derived from the start symbol begin,
+        all nodes if not specified
+    final_nodes: Set, default=None
+        final nodes counted for limit, all nodes if not specified
 
-    return triplets
+    Returns
+    -------
+    set[Tuple[int, str, int]]:
+        set tuples (node, variable, node) for every box call made
+
+    Raises
+    ------
+    ValueError
+        If start node does not present in the graph
+    """
+    graph_index = as_graph_index(graph)
+    answers = _answers_limit(graph_index, cfg, limit, start_nodes, final_nodes)
+    rsm = convert_ecfg_to_rsm(convert_cfg_to_ecfg(cfg)).minimize()
+    sources = (
+        None if start_nodes is None else graph_index.get_indices(start_nodes).tolist()
+    )
+
+    calls, _ = _gll_walk(graph_index, rsm, answers, sources)
+    return _decode_triples(
+        graph_index,
+        {
+            (called_at, variable, node)
+            for (variable, called_at), ends in calls
+            for node in ends
+        },
+    )
+
+
+def gll_descriptors(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    rsm: RSM,
+    start_nodes: Set = None,
+    max_descriptors: int = None,
+) -> int:
+    """
+    Counts descriptors processed by GLL algorithm (see gll),
+    the amount of work of on-demand evaluation from start nodes.
+    RSM is given instead of grammar, so that its construction
+    is not included when the walk is timed
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | GraphIndex
+        input graph or its prebuilt index
+    rsm: RSM
+        RSM of grammar with minimized boxes
+    start_nodes: Set, default=None
+        nodes where paths derived from the start symbol begin,
+        all nodes if not specified
+    max_descriptors: int, default=None
+        walk stops as soon as this count of descriptors is processed
+
+    Returns
+    -------
+    int:
+        count of processed descriptors
+
+    Raises
+    ------
+    ValueError
+        If start node does not present in the graph
+    """
+    graph_index = as_graph_index(graph)
+    sources = (
+        None if start_nodes is None else graph_index.get_indices(start_nodes).tolist()
+    )
+
+    _, descriptors = _gll_walk(
+        graph_index, rsm, sources=sources, max_descriptors=max_descriptors
+    )
+    return descriptors
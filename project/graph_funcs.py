@@ -1,7 +1,9 @@
-from typing import Set, Tuple
+from collections import namedtuple
+from typing import Iterable, Set, Tuple
 
 import cfpq_data
 import networkx as nx
+import numpy as np
 
 __all__ = [
     "Graph",
@@ -9,12 +11,16 @@ __all__ = [
     "create_two_cycles_graph",
     "save_graph_to_dot",
     "get_nfa_by_graph",
+    "EdgeArrays",
+    "get_edge_arrays",
     "add_states_to_nfa",
     "replace_nfa_states",
 ]
 
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State
 
+EdgeArrays = namedtuple("EdgeArrays", ["nodes", "src", "label_ids", "dst", "labels"])
+
 
 class Graph:
     """
@@ -111,6 +117,80 @@ def save_graph_to_dot(graph: nx.MultiDiGraph, file_path: str) -> None:
     pydot_graph.write_raw(file_path)
 
 
+def get_edge_arrays(graph: nx.MultiDiGraph, labels: Iterable = None) -> EdgeArrays:
+    """
+    Converts edges of the graph to integer arrays without creating
+    pyformlang objects, every parallel edge is taken into account.
+    Nodes are numbered by their order in the graph,
+    labels are numbered by their first appearance.
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph
+        Labeled graph
+    labels: Iterable, default=None
+        Only edges with these labels are converted, all edges if not specified
+
+    Returns
+    -------
+    EdgeArrays
+        nodes: node for every index (dtype=object),
+        src, label_ids, dst: int64 arrays describing edges,
+        labels: list of labels, label_ids index it
+    """
+    nodes = np.fromiter(graph.nodes, dtype=object, count=graph.number_of_nodes())
+    empty = np.array([], dtype=np.int64)
+    if not graph.number_of_edges():
+        return EdgeArrays(nodes, empty, empty, empty, [])
+
+    # edges are read from adjacency dicts in the order of graph.edges(keys=True),
+    # so per-edge tuples are never created
+    node_indices = {node: index for index, node in enumerate(nodes)}
+    adjacency = [neighbours for _, neighbours in graph.adjacency()]
+    neighbours_counts = np.fromiter(
+        map(len, adjacency), dtype=np.int64, count=len(adjacency)
+    )
+    neighbours_total = int(neighbours_counts.sum())
+    targets = np.fromiter(
+        (node_indices[v] for neighbours in adjacency for v in neighbours),
+        dtype=np.int64,
+        count=neighbours_total,
+    )
+    parallel_counts = np.fromiter(
+        (len(keys) for neighbours in adjacency for keys in neighbours.values()),
+        dtype=np.int64,
+        count=neighbours_total,
+    )
+    src = np.repeat(
+        np.repeat(np.arange(len(nodes), dtype=np.int64), neighbours_counts),
+        parallel_counts,
+    )
+    dst = np.repeat(targets, parallel_counts)
+
+    label_indices = dict()
+    label_ids = np.fromiter(
+        (
+            label_indices.setdefault(data.get("label"), len(label_indices))
+            for neighbours in adjacency
+            for keys in neighbours.values()
+            for data in keys.values()
+        ),
+        dtype=np.int64,
+        count=len(src),
+    )
+    edge_labels = list(label_indices)
+
+    if labels is not None:
+        labels = set(labels)
+        kept_labels = np.array([label in labels for label in edge_labels], dtype=bool)
+        new_ids = np.cumsum(kept_labels) - 1
+        mask = kept_labels[label_ids]
+        src, dst, label_ids = src[mask], dst[mask], new_ids[label_ids[mask]]
+        edge_labels = [label for label in edge_labels if label in labels]
+
+    return EdgeArrays(nodes, src, label_ids, dst, edge_labels)
+
+
 def get_nfa_by_graph(
     graph: nx.MultiDiGraph, start_nodes: Set[int] = None, final_nodes: Set[int] = None
 ) -> NondeterministicFiniteAutomaton:
@@ -136,10 +216,9 @@ def get_nfa_by_graph(
     """
     nfa = NondeterministicFiniteAutomaton()
 
-    # add the necessary transitions to automaton
-    for node_from, node_to in graph.edges():
-        edge_data = graph.get_edge_data(node_from, node_to)[0]["label"]
-        nfa.add_transition(node_from, edge_data, node_to)
+    # add the necessary transitions to automaton, parallel edges included
+    for node_from, node_to, label in graph.edges(data="label"):
+        nfa.add_transition(node_from, label, node_to)
 
     if (start_nodes and final_nodes) is None:
         if not nfa.states:
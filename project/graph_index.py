@@ -0,0 +1,234 @@
+from typing import Dict, Iterable, Iterator, Tuple, Union
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+from project.graph_funcs import get_edge_arrays
+from project.matrix import (
+    BooleanMatrices,
+    IndexRange,
+    build_label_matrices,
+    convert_matrix,
+    SPARSE_BACKEND,
+)
+
+__all__ = ["GraphIndex", "as_graph_index"]
+
+
+class GraphIndex:
+    """
+    Labeled graph converted to boolean matrices once,
+    to be shared between many queries.
+    Nodes are numbered by their order in the graph.
+    If labels are given, only edges with these labels are indexed.
+
+    Attributes
+    ----------
+    nodes: np.ndarray
+        Node of the graph for every index, dtype=object
+    node_indices: Dict
+        Index of every node of the graph
+    csr_matrices: Dict[str, sparse.csr_matrix]
+        Adjacency matrix in csr format for every label
+    label_stats: Dict[str, int]
+        Count of edges with every label
+    """
+
+    def __init__(self, graph: nx.MultiDiGraph, labels: Iterable = None):
+        edges = get_edge_arrays(graph, labels)
+        self.nodes = edges.nodes
+        self.node_indices = {node: index for index, node in enumerate(self.nodes)}
+
+        matrices = build_label_matrices(
+            edges.src,
+            edges.label_ids,
+            edges.dst,
+            self.number_of_nodes,
+            len(edges.labels),
+        )
+        self._set_matrices(dict(zip(edges.labels, matrices)))
+
+    def _set_matrices(self, csr_matrices: Dict[str, sparse.csr_matrix]):
+        self.csr_matrices = csr_matrices
+        self.label_stats = {
+            label: matrix.nnz for label, matrix in self.csr_matrices.items()
+        }
+        self._csc_matrices = None
+
+    def __contains__(self, node) -> bool:
+        return node in self.node_indices
+
+    @property
+    def number_of_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def number_of_edges(self) -> int:
+        return sum(self.label_stats.values())
+
+    @property
+    def labels(self) -> set:
+        return set(self.csr_matrices.keys())
+
+    @property
+    def csc_matrices(self) -> Dict[str, sparse.csc_matrix]:
+        """
+        Adjacency matrix in csc format for every label, built on first access
+        """
+        if self._csc_matrices is None:
+            self._csc_matrices = {
+                label: matrix.tocsc() for label, matrix in self.csr_matrices.items()
+            }
+        return self._csc_matrices
+
+    def restrict(self, labels: Iterable) -> "GraphIndex":
+        """
+        Creates index of the subgraph with edges of given labels only.
+        Nodes without incident edges of these labels are dropped
+        and the rest are renumbered in their order.
+
+        Parameters
+        ----------
+        labels: Iterable
+            Labels of edges to keep
+
+        Returns
+        -------
+        graph_index: GraphIndex
+            Index of the subgraph, label matrices are not shared with self
+        """
+        labels = set(labels)
+        return self._subgraph(
+            {
+                label: matrix
+                for label, matrix in self.csr_matrices.items()
+                if label in labels
+            }
+        )
+
+    def _subgraph(self, matrices: Dict[str, sparse.csr_matrix]) -> "GraphIndex":
+        """
+        Index of the subgraph with edges of given label matrices
+        and their incident nodes only
+        """
+        used = np.zeros(self.number_of_nodes, dtype=bool)
+        for matrix in matrices.values():
+            rows, cols = matrix.nonzero()
+            used[rows] = True
+            used[cols] = True
+        kept = np.flatnonzero(used)
+
+        graph_index = GraphIndex.__new__(GraphIndex)
+        graph_index.nodes = self.nodes[kept]
+        graph_index.node_indices = {
+            node: index for index, node in enumerate(graph_index.nodes.tolist())
+        }
+        graph_index._set_matrices(
+            {label: matrix[kept][:, kept] for label, matrix in matrices.items()}
+        )
+        return graph_index
+
+    def edges(self) -> Iterator[Tuple[int, str, int]]:
+        """
+        Iterates over edges of the graph
+
+        Returns
+        -------
+        edges: Iterator[Tuple[int, str, int]]
+            Triples (node index, label, node index)
+        """
+        for label, matrix in self.csr_matrices.items():
+            for u, v in zip(*matrix.nonzero()):
+                yield int(u), label, int(v)
+
+    def get_indices(self, nodes: Iterable) -> np.ndarray:
+        """
+        Converts nodes of the graph to their indices
+
+        Parameters
+        ----------
+        nodes: Iterable
+            Nodes of the graph
+
+        Returns
+        -------
+        indices: np.ndarray
+            Sorted indices of nodes
+
+        Raises
+        ------
+        ValueError
+            If node does not present in the graph
+        """
+        indices = []
+        for node in nodes:
+            if node not in self.node_indices:
+                raise ValueError(f"\nNode {node} does not present in the graph")
+            indices.append(self.node_indices[node])
+        return np.array(sorted(indices), dtype=np.int64)
+
+    def to_boolean_matrices(
+        self,
+        start_nodes: Iterable = None,
+        final_nodes: Iterable = None,
+        backend: str = SPARSE_BACKEND,
+    ) -> BooleanMatrices:
+        """
+        Creates boolean matrices of the graph, states are node indices.
+        Label matrices are shared with the index, they must not be modified.
+
+        Parameters
+        ----------
+        start_nodes: Iterable, default=None
+            Start nodes, all nodes if not specified
+        final_nodes: Iterable, default=None
+            Final nodes, all nodes if not specified
+        backend: str
+            Representation of matrices
+
+        Returns
+        -------
+        bm: BooleanMatrices
+            Boolean matrices of the graph
+
+        Raises
+        ------
+        ValueError
+            If node does not present in the graph
+        """
+        bm = BooleanMatrices(backend=backend)
+        bm.states_count = self.number_of_nodes
+        bm.state_indices = IndexRange(self.number_of_nodes)
+        bm.start_states = set(
+            range(self.number_of_nodes)
+            if start_nodes is None
+            else self.get_indices(start_nodes).tolist()
+        )
+        bm.final_states = set(
+            range(self.number_of_nodes)
+            if final_nodes is None
+            else self.get_indices(final_nodes).tolist()
+        )
+        bm.bool_matrices = {
+            label: convert_matrix(matrix, backend)
+            for label, matrix in self.csr_matrices.items()
+        }
+        return bm
+
+
+def as_graph_index(
+    graph: Union[nx.MultiDiGraph, GraphIndex], labels: Iterable = None
+) -> GraphIndex:
+    """
+    Returns given GraphIndex or builds it from the graph.
+    If labels are specified, index is restricted to edges of these labels
+    and their incident nodes (see GraphIndex.restrict).
+    """
+    if isinstance(graph, GraphIndex):
+        return graph if labels is None else graph.restrict(labels)
+    graph_index = GraphIndex(graph, labels)
+    if labels is None:
+        return graph_index
+    # edges of other labels are not indexed, only nodes are left to drop
+    return graph_index._subgraph(graph_index.csr_matrices)
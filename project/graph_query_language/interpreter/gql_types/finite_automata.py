@@ -16,7 +16,11 @@ from project.graph_query_language.interpreter.gql_types.set import (
     Set,
 )
 from project.matrix import BooleanMatrices
-from project.matrix_utils import convert_bm_to_automaton, intersect_boolean_matrices
+from project.matrix_utils import (
+    convert_bm_to_automaton,
+    intersect_boolean_matrices,
+    KRONECKER_INTERSECTION,
+)
 from project.rpq import get_reachable
 
 
@@ -92,7 +96,9 @@ class FiniteAutomata(BaseAutomata):
         except MisformedRegexError as exc:
             raise InvalidCastException("str", "regex") from exc
 
-    def __intersectFiniteAutomata(self, other: "FiniteAutomata") -> "FiniteAutomata":
+    def __intersectFiniteAutomata(
+        self, other: "FiniteAutomata", mode: str
+    ) -> "FiniteAutomata":
         """
         Inner intersection (FiniteAutomata & FiniteAutomata) function
 
@@ -100,6 +106,8 @@ class FiniteAutomata(BaseAutomata):
         ----------
         other: FiniteAutomata
             Finite Automata
+        mode: str
+            Mode of intersect_boolean_matrices
 
         Returns
         -------
@@ -108,7 +116,11 @@ class FiniteAutomata(BaseAutomata):
         """
         lhs = BooleanMatrices(self.nfa)
         rhs = BooleanMatrices(other.nfa)
-        intersection_result = intersect_boolean_matrices(lhs, rhs)
+        # transitions by labels of one automaton only never appear in the product
+        labels = lhs.bool_matrices.keys() & rhs.bool_matrices.keys()
+        intersection_result = intersect_boolean_matrices(
+            lhs.restrict(labels), rhs.restrict(labels), mode
+        )
         return FiniteAutomata(
             nfa=convert_bm_to_automaton(intersection_result),
         )
@@ -130,7 +142,7 @@ class FiniteAutomata(BaseAutomata):
         intersection = other.intersect(self)
         return intersection
 
-    def intersect(self, other) -> "BaseAutomata":
+    def intersect(self, other, mode: str = KRONECKER_INTERSECTION) -> "BaseAutomata":
         """
         Automata & Automata intersection
 
@@ -138,6 +150,8 @@ class FiniteAutomata(BaseAutomata):
         ----------
         other: GqlCFG | FiniteAutomata
             GqlCFG or FiniteAutomata object
+        mode: str
+            Mode of intersect_boolean_matrices for two FiniteAutomata
 
         Returns
         -------
@@ -151,7 +165,7 @@ class FiniteAutomata(BaseAutomata):
             If object does not represent FiniteAutomata or GqlCFG
         """
         if isinstance(other, FiniteAutomata):
-            return self.__intersectFiniteAutomata(other=other)
+            return self.__intersectFiniteAutomata(other=other, mode=mode)
 
         if isinstance(other, GqlCFG):
             return self.__intersectCFG(other=other)
@@ -0,0 +1,255 @@
+from collections import Counter
+from typing import Iterable, Set, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+from project.graph_funcs import get_edge_arrays
+from project.matrix import (
+    BooleanMatrices,
+    add_closure_edges,
+    convert_matrix,
+    new_elements,
+    scc_transitive_closure,
+    SPARSE_BACKEND,
+)
+from project.regex import regex_to_min_dfa
+
+__all__ = ["IncrementalRpq"]
+
+
+class IncrementalRpq:
+    """
+    Regular Path Query which result is maintained under edge insertions
+    and deletions. The transitive closure of the product of graph and query
+    is computed once and then updated:
+    - after insertions, pairs passing through new product edges are added,
+      R[:, sources] @ R[targets, :] with R = closure + identity,
+      until no new pairs appear;
+    - after deletions, only the rows of closure for product states reaching
+      a removed product edge are recomputed by BFS.
+
+    Attributes
+    ----------
+    query: str
+        Regular expression
+    start_nodes: set
+        Start nodes, all nodes if None
+    final_nodes: set
+        Final nodes, all nodes if None
+    """
+
+    def __init__(
+        self,
+        graph: nx.MultiDiGraph,
+        query: str,
+        start_nodes: set = None,
+        final_nodes: set = None,
+    ):
+        self.query = query
+        self.start_nodes = start_nodes
+        self.final_nodes = final_nodes
+
+        query_bm = BooleanMatrices(regex_to_min_dfa(query))
+        self._query_size = query_bm.states_count
+        self._query_starts = query_bm.get_start_indices()
+        self._query_finals = query_bm.get_final_indices()
+        self._query_transitions = {
+            label: sparse.csr_matrix(convert_matrix(matrix, SPARSE_BACKEND)).nonzero()
+            for label, matrix in query_bm.bool_matrices.items()
+        }
+
+        # counts of parallel edges are needed to delete them one by one,
+        # so the graph itself is required instead of its boolean matrices
+        edges = get_edge_arrays(graph)
+        self._nodes = list(edges.nodes)
+        self._node_indices = {node: index for index, node in enumerate(self._nodes)}
+        self._edge_counts = Counter(
+            zip(
+                edges.src.tolist(),
+                [edges.labels[label_id] for label_id in edges.label_ids.tolist()],
+                edges.dst.tolist(),
+            )
+        )
+
+        rows, cols = self._product_edges(self._edge_counts.keys())
+        self._adjacency = self._with_entries(self._empty(), rows, cols)
+        self._closure = scc_transitive_closure(self._adjacency)
+
+    @property
+    def _product_size(self) -> int:
+        return len(self._nodes) * self._query_size
+
+    def _product_edges(
+        self, edges: Iterable[Tuple[int, str, int]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Product edges (u * m + q, v * m + p) for graph edges (u, label, v)
+        and query transitions (q, label, p)
+        """
+        rows, cols = [], []
+        for u, label, v in edges:
+            if label not in self._query_transitions:
+                continue
+            query_from, query_to = self._query_transitions[label]
+            rows.append(u * self._query_size + query_from)
+            cols.append(v * self._query_size + query_to)
+        if not rows:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def _with_entries(self, matrix, rows: np.ndarray, cols: np.ndarray):
+        return matrix + sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=matrix.shape
+        )
+
+    def _empty(self) -> sparse.csr_matrix:
+        return sparse.csr_matrix((self._product_size,) * 2, dtype=bool)
+
+    def _get_index(self, node) -> int:
+        if node not in self._node_indices:
+            self._node_indices[node] = len(self._nodes)
+            self._nodes.append(node)
+        return self._node_indices[node]
+
+    def _resize(self):
+        size = self._product_size
+        if self._adjacency.shape[0] != size:
+            self._adjacency.resize((size, size))
+            self._closure.resize((size, size))
+
+    def add_edge(self, node_from, label, node_to) -> None:
+        self.add_edges([(node_from, label, node_to)])
+
+    def remove_edge(self, node_from, label, node_to) -> None:
+        self.remove_edges([(node_from, label, node_to)])
+
+    def add_edges(self, edges: Iterable[Tuple]) -> None:
+        """
+        Inserts a batch of edges and updates the closure
+
+        Parameters
+        ----------
+        edges: Iterable[Tuple]
+            Triples (node, label, node), unknown nodes are added to the graph
+        """
+        new_edges = []
+        for u, label, v in edges:
+            edge = (self._get_index(u), label, self._get_index(v))
+            self._edge_counts[edge] += 1
+            if self._edge_counts[edge] == 1:
+                new_edges.append(edge)
+        self._resize()
+
+        sources, targets = self._product_edges(new_edges)
+        if not len(sources):
+            return
+        self._adjacency = self._with_entries(self._adjacency, sources, targets)
+
+        self._closure, _ = add_closure_edges(self._closure, sources, targets)
+
+    def remove_edges(self, edges: Iterable[Tuple]) -> None:
+        """
+        Deletes a batch of edges and updates the closure.
+        Parallel edge is removed once per occurrence in the batch.
+
+        Parameters
+        ----------
+        edges: Iterable[Tuple]
+            Triples (node, label, node)
+
+        Raises
+        ------
+        ValueError
+            If edge does not present in the graph, then no edge is deleted
+        """
+        batch = Counter()
+        for u, label, v in edges:
+            edge = (self._node_indices.get(u), label, self._node_indices.get(v))
+            batch[edge] += 1
+            # the whole batch is checked before the graph is changed
+            if self._edge_counts[edge] < batch[edge]:
+                raise ValueError(
+                    f"\nEdge {(u, label, v)} does not present in the graph"
+                )
+
+        removed_edges = []
+        for edge, count in batch.items():
+            self._edge_counts[edge] -= count
+            if self._edge_counts[edge] == 0:
+                del self._edge_counts[edge]
+                removed_edges.append(edge)
+
+        sources, targets = self._product_edges(removed_edges)
+        if not len(sources):
+            return
+        # product edge may be also produced by remaining edge with other label
+        remaining_rows, remaining_cols = self._product_edges(
+            (u, label, v)
+            for u, _, v in removed_edges
+            for label in self._query_transitions
+            if (u, label, v) in self._edge_counts
+        )
+        removed = new_elements(
+            self._with_entries(self._empty(), sources, targets),
+            self._with_entries(self._empty(), remaining_rows, remaining_cols),
+        )
+        self._adjacency = new_elements(self._adjacency, removed)
+        sources, targets = removed.nonzero()
+        if not len(sources):
+            return
+
+        # only states which reach a removed edge may lose reachable pairs
+        affected = np.union1d(sources, self._closure[:, np.unique(sources)].tocoo().row)
+        front = self._adjacency[affected, :]
+        reachable = front
+        while front.nnz:
+            front = new_elements(
+                sparse.csr_matrix(front @ self._adjacency, dtype=bool), reachable
+            )
+            reachable = reachable + front
+
+        kept = np.ones(self._product_size, dtype=bool)
+        kept[affected] = False
+        select = sparse.csr_matrix(
+            (np.ones(len(affected), dtype=bool), (affected, np.arange(len(affected)))),
+            shape=(self._product_size, len(affected)),
+        )
+        self._closure = sparse.csr_matrix(
+            sparse.diags(kept, dtype=bool, format="csr") @ self._closure
+            + select @ reachable,
+            dtype=bool,
+        )
+
+    def _node_set_indices(self, nodes) -> np.ndarray:
+        if nodes is None:
+            return np.arange(len(self._nodes))
+        return np.array(
+            sorted(self._node_indices[n] for n in nodes if n in self._node_indices),
+            dtype=np.int64,
+        )
+
+    @property
+    def reachable(self) -> Set[Tuple]:
+        """
+        Current result of the query: pairs of nodes connected
+        by a non-empty path accepted by query
+        """
+        m = self._query_size
+        start_rows = (
+            self._node_set_indices(self.start_nodes)[:, None] * m
+            + self._query_starts[None, :]
+        ).ravel()
+        final_cols = (
+            self._node_set_indices(self.final_nodes)[:, None] * m
+            + self._query_finals[None, :]
+        ).ravel()
+
+        pairs = self._closure[start_rows][:, final_cols].tocoo()
+        return set(
+            zip(
+                (self._nodes[i // m] for i in start_rows[pairs.row]),
+                (self._nodes[j // m] for j in final_cols[pairs.col]),
+            )
+        )
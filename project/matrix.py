@@ -1,13 +1,278 @@
+from collections import namedtuple
+from collections.abc import Mapping
+from typing import Iterable, Tuple
+
+import numpy as np
 from pyformlang.cfg import Variable
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State
 from scipy import sparse
+from scipy.sparse.csgraph import connected_components
 
-__all__ = ["BooleanMatrices"]
+__all__ = [
+    "BooleanMatrices",
+    "IndexRange",
+    "SPARSE_BACKEND",
+    "BITPACKED_BACKEND",
+    "convert_matrix",
+    "empty_matrix",
+    "identity_matrix",
+    "build_label_matrices",
+    "ClosureStats",
+    "new_elements",
+    "SEMI_NAIVE_CLOSURE",
+    "SCC_CLOSURE",
+    "scc_transitive_closure",
+    "add_closure_edges",
+]
 
 from scipy.sparse import dok_matrix
 
+from project.bit_matrix import BitMatrix
 from project.rsm import RSM, Box
 
+SPARSE_BACKEND = "sparse"
+BITPACKED_BACKEND = "bitpacked"
+
+SEMI_NAIVE_CLOSURE = "semi-naive"
+SCC_CLOSURE = "scc"
+
+ClosureStats = namedtuple("ClosureStats", ["iterations", "nnz_history"])
+
+
+class IndexRange(Mapping):
+    """
+    Arithmetic mapping of integer states 0..n-1 to the same matrix indices.
+    Used instead of dict when states are numbered by matrix indices,
+    e.g. for intersections where state (i, j) is i * m + j.
+
+    Attributes
+    ----------
+    n: int
+        Count of states
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+
+    def __getitem__(self, state):
+        if isinstance(state, (int, np.integer)) and 0 <= state < self.n:
+            return state
+        raise KeyError(state)
+
+    def __contains__(self, state):
+        return isinstance(state, (int, np.integer)) and 0 <= state < self.n
+
+    def __iter__(self):
+        return iter(range(self.n))
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return f"IndexRange({self.n})"
+
+
+def build_label_matrices(
+    src: np.ndarray, label_ids: np.ndarray, dst: np.ndarray, n: int, labels_count: int
+) -> list:
+    """
+    Groups edges by label and builds n x n csr matrix for every label
+
+    Parameters
+    ----------
+    src: np.ndarray
+        Indices of states from which edges start
+    label_ids: np.ndarray
+        Integer labels of edges in range [0, labels_count)
+    dst: np.ndarray
+        Indices of states in which edges end
+    n: int
+        Count of states
+    labels_count: int
+        Count of different labels
+
+    Returns
+    -------
+    matrices: list
+        List of csr matrices, i-th matrix holds edges with label i
+    """
+    order = np.argsort(label_ids, kind="stable")
+    src, dst = src[order], dst[order]
+    bounds = np.searchsorted(label_ids[order], np.arange(labels_count + 1))
+
+    matrices = []
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        matrices.append(
+            sparse.coo_matrix(
+                (np.ones(end - begin, dtype=bool), (src[begin:end], dst[begin:end])),
+                shape=(n, n),
+            ).tocsr()
+        )
+    return matrices
+
+
+def new_elements(candidates, known):
+    """
+    Returns boolean matrix of elements from candidates which are absent in known
+    """
+    if isinstance(candidates, BitMatrix):
+        return candidates - known
+    return candidates > known
+
+
+def scc_transitive_closure(adjacency) -> sparse.csr_matrix:
+    """
+    Makes transitive closure of adjacency matrix by condensation of its
+    strongly connected components: every component is collapsed into one vertex,
+    the condensed DAG is closed in reverse topological order and
+    the result is expanded back to the vertices of components.
+
+    Parameters
+    ----------
+    adjacency: spmatrix
+        Square boolean adjacency matrix
+
+    Returns
+    -------
+    tc: csr_matrix
+        Transitive closure of adjacency matrix
+    """
+    adjacency = sparse.csr_matrix(adjacency, dtype=bool)
+    n = adjacency.shape[0]
+    count, labels = connected_components(adjacency, directed=True, connection="strong")
+    membership = sparse.csr_matrix(
+        (np.ones(n, dtype=bool), (np.arange(n), labels)), shape=(n, count)
+    )
+
+    condensed = sparse.csr_matrix(membership.T @ adjacency @ membership, dtype=bool)
+    # component is cyclic if it has an inner edge, i.e. a self-loop after condensation
+    cyclic = condensed.diagonal()
+    condensed.setdiag(False)
+    condensed.eliminate_zeros()
+    predecessors = condensed.T.tocsr()
+
+    out_degree = np.diff(condensed.indptr)
+    ready = list(np.flatnonzero(out_degree == 0))
+    reach = [None] * count
+    while ready:
+        component = ready.pop()
+        successors = condensed.indices[
+            condensed.indptr[component] : condensed.indptr[component + 1]
+        ]
+        reach[component] = np.unique(
+            np.concatenate([successors] + [reach[s] for s in successors])
+        )
+        for p in predecessors.indices[
+            predecessors.indptr[component] : predecessors.indptr[component + 1]
+        ]:
+            out_degree[p] -= 1
+            if out_degree[p] == 0:
+                ready.append(p)
+
+    rows = np.repeat(np.arange(count), [len(r) for r in reach])
+    cols = np.concatenate(reach) if count else np.array([], dtype=np.int64)
+    condensed_tc = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(count, count)
+    ) + sparse.diags(cyclic, dtype=bool, format="csr")
+
+    return sparse.csr_matrix(membership @ condensed_tc @ membership.T, dtype=bool)
+
+
+def add_closure_edges(
+    closure: sparse.csr_matrix, sources: np.ndarray, targets: np.ndarray
+) -> Tuple[sparse.csr_matrix, sparse.csr_matrix]:
+    """
+    Updates transitive closure after insertion of edges sources[i] -> targets[i].
+    Pairs connected through new edges, R[:, sources] @ R[targets, :]
+    with R = closure + identity, are added until no new pairs appear.
+
+    Parameters
+    ----------
+    closure: csr_matrix
+        Transitive closure of the graph before insertion
+    sources: np.ndarray
+        Indices of vertices from which new edges start
+    targets: np.ndarray
+        Indices of vertices in which new edges end
+
+    Returns
+    -------
+    closure, delta: Tuple[csr_matrix, csr_matrix]
+        Transitive closure after insertion and its pairs absent before insertion
+    """
+    delta = sparse.csr_matrix(closure.shape, dtype=bool)
+    if not len(sources):
+        return closure, delta
+
+    identity = sparse.identity(closure.shape[0], dtype=bool, format="csr")
+    while True:
+        reflexive = sparse.csr_matrix(closure + identity)
+        through_new = sparse.csr_matrix(
+            reflexive[:, sources] @ reflexive[targets, :], dtype=bool
+        )
+        new_pairs = new_elements(through_new, closure)
+        if not new_pairs.nnz:
+            return closure, delta
+        closure = sparse.csr_matrix(closure + new_pairs)
+        delta = delta + new_pairs
+
+
+def _check_backend(backend: str):
+    if backend not in (SPARSE_BACKEND, BITPACKED_BACKEND):
+        raise ValueError(
+            f"Unknown matrix backend '{backend}', "
+            f"expected '{SPARSE_BACKEND}' or '{BITPACKED_BACKEND}'"
+        )
+
+
+def convert_matrix(matrix, backend: str):
+    """
+    Converts boolean matrix to the representation of given backend
+
+    Parameters
+    ----------
+    matrix: spmatrix | BitMatrix
+        Matrix to convert
+    backend: str
+        SPARSE_BACKEND or BITPACKED_BACKEND
+
+    Returns
+    -------
+    matrix: spmatrix | BitMatrix
+        Matrix in the representation of backend
+
+    Raises
+    ------
+    ValueError
+        If backend is unknown
+    """
+    _check_backend(backend)
+    if backend == BITPACKED_BACKEND:
+        return (
+            matrix if isinstance(matrix, BitMatrix) else BitMatrix.from_sparse(matrix)
+        )
+    return matrix.to_sparse() if isinstance(matrix, BitMatrix) else matrix
+
+
+def empty_matrix(rows: int, cols: int, backend: str = SPARSE_BACKEND):
+    """
+    Creates boolean matrix without True elements in the representation of given backend
+    """
+    _check_backend(backend)
+    if backend == BITPACKED_BACKEND:
+        return BitMatrix((rows, cols))
+    return dok_matrix((rows, cols), dtype=bool)
+
+
+def identity_matrix(n: int, backend: str = SPARSE_BACKEND):
+    """
+    Creates boolean identity matrix in the representation of given backend
+    """
+    _check_backend(backend)
+    if backend == BITPACKED_BACKEND:
+        return BitMatrix.identity(n)
+    return sparse.identity(n, dtype=bool).todok()
+
 
 class BooleanMatrices:
     """
@@ -17,8 +282,8 @@ class BooleanMatrices:
     ----------
     states_count: set
         Count of states
-    state_indices: dict
-        Dictionary of states
+    state_indices: Mapping
+        Mapping of states to matrix indices (dict or IndexRange)
     start_states: set
         Start states of NFA
     final_states: set
@@ -26,9 +291,22 @@ class BooleanMatrices:
     bool_matrices: dict
         Dictionary of boolean matrices.
         Keys are NFA symbols
+    backend: str
+        Representation of matrices: SPARSE_BACKEND (scipy sparse matrices)
+        or BITPACKED_BACKEND (BitMatrix, rows packed into 64-bit words)
+    closure_stats: ClosureStats
+        Number of iterations and nnz after every iteration
+        of the last make_transitive_closure call
     """
 
-    def __init__(self, n_automaton: NondeterministicFiniteAutomaton = None):
+    def __init__(
+        self,
+        n_automaton: NondeterministicFiniteAutomaton = None,
+        backend: str = SPARSE_BACKEND,
+    ):
+        _check_backend(backend)
+        self.backend = backend
+        self.closure_stats = None
         if n_automaton is None:
             self.states_count = 0
             self.state_indices = dict()
@@ -55,6 +333,33 @@ class BooleanMatrices:
     def get_final_states(self):
         return self.final_states
 
+    def get_start_indices(self) -> np.ndarray:
+        """
+        Returns sorted matrix indices of start states
+        """
+        return self._get_indices(self.start_states)
+
+    def get_final_indices(self) -> np.ndarray:
+        """
+        Returns sorted matrix indices of final states
+        """
+        return self._get_indices(self.final_states)
+
+    def _get_indices(self, states) -> np.ndarray:
+        if isinstance(self.state_indices, IndexRange):
+            return np.sort(np.fromiter(states, dtype=np.int64, count=len(states)))
+        return np.array(
+            sorted(self.state_indices[state] for state in states), dtype=np.int64
+        )
+
+    def get_index_states(self) -> Mapping:
+        """
+        Returns mapping of matrix indices to states
+        """
+        if isinstance(self.state_indices, IndexRange):
+            return self.state_indices
+        return {index: state for state, index in self.state_indices.items()}
+
     def init_bool_matrices(self, n_automaton: NondeterministicFiniteAutomaton):
         """
         Initialize boolean matrices of NondeterministicFiniteAutomaton
@@ -69,47 +374,236 @@ class BooleanMatrices:
         bool_matrices: dict
             Dict of boolean matrix for every automata label-key
         """
-        bool_matrices = dict()
-        nfa_dict = n_automaton.to_dict()
-        for state_from, trans in nfa_dict.items():
-            for label, states_to in trans.items():
-                if not isinstance(states_to, set):
-                    states_to = {states_to}
-                for state_to in states_to:
-                    index_from = self.state_indices[state_from]
-                    index_to = self.state_indices[state_to]
-                    if label not in bool_matrices:
-                        bool_matrices[label] = sparse.dok_matrix(
-                            (self.states_count, self.states_count), dtype=bool
-                        )
-                    bool_matrices[label][index_from, index_to] = True
+        src, labels, dst = [], [], []
+        for state_from, label, state_to in n_automaton:
+            src.append(self.state_indices[state_from])
+            labels.append(label)
+            dst.append(self.state_indices[state_to])
+
+        return self._build_bool_matrices(src, labels, dst)
+
+    def _build_bool_matrices(self, src, labels, dst) -> dict:
+        """
+        Builds boolean matrices from parallel lists of transitions
+
+        Parameters
+        ----------
+        src: list
+            Indices of states from which transitions start
+        labels: list
+            Labels of transitions, any hashable objects
+        dst: list
+            Indices of states in which transitions end
+
+        Returns
+        -------
+        bool_matrices: dict
+            Dict of boolean matrix for every label
+        """
+        label_ids = dict()
+        ids = [label_ids.setdefault(label, len(label_ids)) for label in labels]
+        matrices = build_label_matrices(
+            np.asarray(src, dtype=np.int64),
+            np.asarray(ids, dtype=np.int64),
+            np.asarray(dst, dtype=np.int64),
+            self.states_count,
+            len(label_ids),
+        )
+        return {
+            label: convert_matrix(matrices[label_id], self.backend)
+            for label, label_id in label_ids.items()
+        }
+
+    @classmethod
+    def from_edge_arrays(
+        cls,
+        src,
+        label_ids,
+        dst,
+        n: int,
+        start_states=None,
+        final_states=None,
+        backend: str = SPARSE_BACKEND,
+    ) -> "BooleanMatrices":
+        """
+        Create an instance of BooleanMatrices from arrays of labeled edges.
+        States are integers 0..n-1, every label matrix is built by one COO -> CSR call.
+        If start_states or final_states is not specified,
+        all states are considered start or final respectively.
+
+        Parameters
+        ----------
+        src: array_like
+            Indices of states from which edges start
+        label_ids: array_like
+            Labels of edges
+        dst: array_like
+            Indices of states in which edges end
+        n: int
+            Count of states
+        start_states: Iterable[int], default=None
+            Start states, all states if not specified
+        final_states: Iterable[int], default=None
+            Final states, all states if not specified
+        backend: str
+            Representation of created matrices
+
+        Returns
+        -------
+        bm: BooleanMatrices
+            Boolean matrices of given edges
+
+        Raises
+        ------
+        ValueError
+            If arrays have different lengths
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        label_ids = np.asarray(label_ids)
+        if not (len(src) == len(label_ids) == len(dst)):
+            raise ValueError("Edge arrays must have the same length")
+
+        bm = cls(backend=backend)
+        bm.states_count = n
+        bm.state_indices = IndexRange(n)
+        bm.start_states = set(range(n) if start_states is None else start_states)
+        bm.final_states = set(range(n) if final_states is None else final_states)
+
+        labels, ids = np.unique(label_ids, return_inverse=True)
+        matrices = build_label_matrices(src, ids.ravel(), dst, n, len(labels))
+        bm.bool_matrices = {
+            label: convert_matrix(matrices[label_id], backend)
+            for label_id, label in enumerate(labels.tolist())
+        }
+        return bm
+
+    def to_backend(self, backend: str) -> "BooleanMatrices":
+        """
+        Converts all boolean matrices to the representation of given backend
+
+        Parameters
+        ----------
+        backend: str
+            SPARSE_BACKEND or BITPACKED_BACKEND
+
+        Returns
+        -------
+        self: BooleanMatrices
+            The same object with converted matrices
+        """
+        _check_backend(backend)
+        self.backend = backend
+        self.bool_matrices = {
+            label: convert_matrix(bool_matrix, backend)
+            for label, bool_matrix in self.bool_matrices.items()
+        }
+        return self
+
+    def restrict(self, labels: Iterable) -> "BooleanMatrices":
+        """
+        Creates boolean matrices with transitions by given labels only.
+        States without incident transitions by these labels are dropped,
+        except states which are both start and final (they accept empty word),
+        the rest get compacted matrix indices in their order.
+
+        Parameters
+        ----------
+        labels: Iterable
+            Labels of transitions to keep
+
+        Returns
+        -------
+        bm: BooleanMatrices
+            Restricted boolean matrices with the same backend
+        """
+        labels = set(labels)
+        matrices = {
+            label: sparse.csr_matrix(convert_matrix(bool_matrix, SPARSE_BACKEND))
+            for label, bool_matrix in self.bool_matrices.items()
+            if label in labels
+        }
 
-        return bool_matrices
+        used = np.zeros(self.states_count, dtype=bool)
+        for bool_matrix in matrices.values():
+            rows, cols = bool_matrix.nonzero()
+            used[rows] = True
+            used[cols] = True
+        used[self._get_indices(set(self.start_states) & set(self.final_states))] = True
+        kept = np.flatnonzero(used)
 
-    def make_transitive_closure(self):
+        index_states = self.get_index_states()
+        bm = BooleanMatrices(backend=self.backend)
+        bm.states_count = len(kept)
+        bm.state_indices = {
+            index_states[index]: new_index
+            for new_index, index in enumerate(kept.tolist())
+        }
+        bm.start_states = {s for s in self.start_states if s in bm.state_indices}
+        bm.final_states = {s for s in self.final_states if s in bm.state_indices}
+        bm.bool_matrices = {
+            label: convert_matrix(bool_matrix[kept][:, kept], self.backend)
+            for label, bool_matrix in matrices.items()
+        }
+        bm.states_to_box_variable = self.states_to_box_variable
+        return bm
+
+    def make_transitive_closure(self, engine: str = SEMI_NAIVE_CLOSURE):
         """
-        Makes transitive closure of boolean matrices
+        Makes transitive closure of boolean matrices.
+        SEMI_NAIVE_CLOSURE engine on every iteration multiplies by the closure
+        only the pairs discovered on the previous iteration,
+        i.e. delta = (delta @ tc) without tc.
+        SCC_CLOSURE engine condenses strongly connected components first
+        and closes the condensed DAG in one pass (see scc_transitive_closure).
+        Iterations count and nnz growth are saved to closure_stats.
+
+        Parameters
+        ----------
+        engine: str
+            SEMI_NAIVE_CLOSURE or SCC_CLOSURE
 
         Returns
         -------
-        tc: dok_matrix
+        tc: spmatrix | BitMatrix
             Transitive closure of boolean matrices
+
+        Raises
+        ------
+        ValueError
+            If engine is unknown
         """
         if not self.bool_matrices.values():
+            self.closure_stats = ClosureStats(0, [0])
             return dok_matrix((1, 1))
 
         tc = sum(self.bool_matrices.values())
-        prev_nnz = tc.nnz
-        curr_nnz = 0
+        if engine == SCC_CLOSURE:
+            initial_nnz = tc.nnz
+            tc = convert_matrix(
+                scc_transitive_closure(convert_matrix(tc, SPARSE_BACKEND)),
+                self.backend,
+            )
+            self.closure_stats = ClosureStats(1, [initial_nnz, tc.nnz])
+            return tc
+        if engine != SEMI_NAIVE_CLOSURE:
+            raise ValueError(f"Unknown transitive closure engine '{engine}'")
 
-        while prev_nnz != curr_nnz:
-            tc += tc @ tc
-            prev_nnz, curr_nnz = curr_nnz, tc.nnz
+        if not isinstance(tc, BitMatrix):
+            tc = sparse.csr_matrix(tc, dtype=bool)
 
+        delta = tc
+        nnz_history = [tc.nnz]
+        while delta.nnz:
+            delta = new_elements(delta @ tc, tc)
+            tc = tc + delta
+            nnz_history.append(tc.nnz)
+
+        self.closure_stats = ClosureStats(len(nnz_history) - 1, nnz_history)
         return tc
 
     @classmethod
-    def from_rsm(cls, rsm: RSM):
+    def from_rsm(cls, rsm: RSM, backend: str = SPARSE_BACKEND):
         """
         Create an instance of BooleanMatrices from rsm
 
@@ -117,18 +611,21 @@ class BooleanMatrices:
         ----------
         rsm: RSM
             Recursive State Machine
+        backend: str
+            Representation of created matrices
         """
         bm = cls()
         bm.states_count = sum(len(box.dfa.states) for box in rsm.boxes)
+        src, labels, dst = [], [], []
         box_idx = 0
         for box in rsm.boxes:
             for idx, state in enumerate(box.dfa.states):
                 new_name = bm._rename_rsm_box_state(state, box.variable)
                 bm.state_indices[new_name] = idx + box_idx
                 if state in box.dfa.start_states:
-                    bm.start_states.add(bm.state_indices[new_name])
+                    bm.start_states.add(new_name)
                 if state in box.dfa.final_states:
-                    bm.final_states.add(bm.state_indices[new_name])
+                    bm.final_states.add(new_name)
 
             bm.states_to_box_variable.update(
                 {
@@ -141,47 +638,19 @@ class BooleanMatrices:
                     for state in box.dfa.final_states
                 }
             )
-            bm.bool_matrices.update(bm._create_box_bool_matrices(box))
+            for s_from, label, s_to in box.dfa:
+                src.append(
+                    bm.state_indices[bm._rename_rsm_box_state(s_from, box.variable)]
+                )
+                labels.append(label)
+                dst.append(
+                    bm.state_indices[bm._rename_rsm_box_state(s_to, box.variable)]
+                )
             box_idx += len(box.dfa.states)
 
-        return bm
+        bm.bool_matrices = bm._build_bool_matrices(src, labels, dst)
+        return bm.to_backend(backend)
 
     @staticmethod
     def _rename_rsm_box_state(state: State, box_variable: Variable):
         return State(f"{state.value}#{box_variable.value}")
-
-    def _create_box_bool_matrices(self, box: Box) -> dict:
-        """
-        Create bool matrices for RSM box
-        Attributes
-        ----------
-        box: Box
-            Box of RSM
-        Returns
-        -------
-        bmatrix: dict
-            Boolean Matrices dict
-        """
-        bmatrix = {}
-        for s_from, trans in box.dfa.to_dict().items():
-            for label, states_to in trans.items():
-                if not isinstance(states_to, set):
-                    states_to = {states_to}
-                for s_to in states_to:
-                    idx_from = self.state_indices[
-                        self._rename_rsm_box_state(s_from, box.variable)
-                    ]
-                    idx_to = self.state_indices[
-                        self._rename_rsm_box_state(s_to, box.variable)
-                    ]
-
-                    if label in self.bool_matrices:
-                        self.bool_matrices[label][idx_from, idx_to] = True
-                        continue
-                    if label not in bmatrix:
-                        bmatrix[label] = sparse.dok_matrix(
-                            (self.states_count, self.states_count), dtype=bool
-                        )
-                    bmatrix[label][idx_from, idx_to] = True
-
-        return bmatrix
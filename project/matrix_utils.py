@@ -1,14 +1,37 @@
+from typing import Tuple
+
+import numpy as np
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State
 from scipy import sparse
 
-from project.matrix import BooleanMatrices
-
-__all__ = ["intersect_boolean_matrices", "convert_bm_to_automaton"]
-
-
-def intersect_boolean_matrices(self: BooleanMatrices, other: BooleanMatrices):
+from project.matrix import (
+    BooleanMatrices,
+    IndexRange,
+    convert_matrix,
+    build_label_matrices,
+    SPARSE_BACKEND,
+)
+
+__all__ = [
+    "intersect_boolean_matrices",
+    "convert_bm_to_automaton",
+    "KRONECKER_INTERSECTION",
+    "ON_THE_FLY_INTERSECTION",
+]
+
+KRONECKER_INTERSECTION = "kronecker"
+ON_THE_FLY_INTERSECTION = "on-the-fly"
+
+
+def intersect_boolean_matrices(
+    self: BooleanMatrices,
+    other: BooleanMatrices,
+    mode: str = KRONECKER_INTERSECTION,
+):
     """
-    Makes intersection of self boolean matrix with other
+    Makes intersection of self boolean matrix with other.
+    State (i, j) of the intersection has key i * other.states_count + j,
+    where i and j are indices of states in self and other.
 
     Parameters
     ----------
@@ -16,33 +39,165 @@ def intersect_boolean_matrices(self: BooleanMatrices, other: BooleanMatrices):
         Left-hand side boolean matrix
     other: BooleanMatrices
         Right-hand side boolean matrix
+    mode: str
+        KRONECKER_INTERSECTION builds Kronecker products of label matrices.
+        ON_THE_FLY_INTERSECTION explores only the pairs of states reachable
+        from start states and never builds the Kronecker products,
+        states of the result are renumbered compactly.
 
     Returns
     -------
     intersect_bm: BooleanMatrices
-        Intersection of two boolean matrices
+        Intersection of two boolean matrices.
+        Its matrices are represented in the backend of self
+
+    Raises
+    ------
+    ValueError
+        If mode is unknown
     """
-    intersect_bm = BooleanMatrices()
-    intersect_bm.num_states = self.states_count * other.states_count
+    if mode == ON_THE_FLY_INTERSECTION:
+        return _intersect_on_the_fly(self, other)
+    if mode != KRONECKER_INTERSECTION:
+        raise ValueError(f"Unknown intersection mode '{mode}'")
+
+    intersect_bm = BooleanMatrices(backend=self.backend)
+    intersect_bm.states_count = self.states_count * other.states_count
+    intersect_bm.state_indices = IndexRange(intersect_bm.states_count)
     common_symbols = self.bool_matrices.keys() & other.bool_matrices.keys()
 
     for symbol in common_symbols:
-        intersect_bm.bool_matrices[symbol] = sparse.kron(
-            self.bool_matrices[symbol], other.bool_matrices[symbol], format="dok"
+        intersect_bm.bool_matrices[symbol] = convert_matrix(
+            sparse.kron(
+                convert_matrix(self.bool_matrices[symbol], SPARSE_BACKEND),
+                convert_matrix(other.bool_matrices[symbol], SPARSE_BACKEND),
+                format="csr",
+            ),
+            intersect_bm.backend,
         )
 
-    for state_fst, state_fst_index in self.state_indices.items():
-        for state_snd, state_snd_idx in other.state_indices.items():
-            new_state = new_state_idx = (
-                state_fst_index * other.states_count + state_snd_idx
-            )
-            intersect_bm.state_indices[new_state] = new_state_idx
+    intersect_bm.start_states = set(
+        _product_indices(
+            self.get_start_indices(), other.get_start_indices(), other.states_count
+        ).tolist()
+    )
+    intersect_bm.final_states = set(
+        _product_indices(
+            self.get_final_indices(), other.get_final_indices(), other.states_count
+        ).tolist()
+    )
+
+    return intersect_bm
+
+
+def _product_indices(fst: np.ndarray, snd: np.ndarray, snd_count: int) -> np.ndarray:
+    """
+    Indices of all pairs (i, j) of product states, i from fst and j from snd
+    """
+    return (fst[:, None] * snd_count + snd[None, :]).ravel()
 
-            if state_fst in self.start_states and state_snd in other.start_states:
-                intersect_bm.start_states.add(new_state)
 
-            if state_fst in self.final_states and state_snd in other.final_states:
-                intersect_bm.final_states.add(new_state)
+def _gather_rows(
+    matrix: sparse.csr_matrix, rows: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Collects nonzero columns of given csr matrix rows
+
+    Returns
+    -------
+    owners: np.ndarray
+        Position in rows of every collected column, non-decreasing
+    cols: np.ndarray
+        Collected columns
+    counts: np.ndarray
+        Count of collected columns for every row
+    """
+    starts = matrix.indptr[rows]
+    counts = matrix.indptr[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners, matrix.indices[starts[owners] + offsets], counts
+
+
+def _intersect_on_the_fly(self: BooleanMatrices, other: BooleanMatrices):
+    """
+    Builds the part of intersection reachable from start states
+    by breadth-first traversal over pairs of states.
+    Successors of a frontier pair (i, j) by symbol are all pairs (k, l)
+    where k is in the csr row i of self and l is in the csr row j of other.
+    """
+    m = other.states_count
+    common_symbols = list(self.bool_matrices.keys() & other.bool_matrices.keys())
+    fst_matrices = [
+        sparse.csr_matrix(convert_matrix(self.bool_matrices[s], SPARSE_BACKEND))
+        for s in common_symbols
+    ]
+    snd_matrices = [
+        sparse.csr_matrix(convert_matrix(other.bool_matrices[s], SPARSE_BACKEND))
+        for s in common_symbols
+    ]
+
+    frontier = _product_indices(self.get_start_indices(), other.get_start_indices(), m)
+    visited = np.zeros(self.states_count * m, dtype=bool)
+    visited[frontier] = True
+    discovered = [frontier]
+    src, labels, dst = [], [], []
+
+    while frontier.size:
+        fst_rows, snd_rows = frontier // m, frontier % m
+        next_frontier = []
+        for label_id, (fst, snd) in enumerate(zip(fst_matrices, snd_matrices)):
+            fst_owners, fst_cols, _ = _gather_rows(fst, fst_rows)
+            snd_owners, snd_cols, snd_counts = _gather_rows(snd, snd_rows)
+            # join by frontier position: every fst column with every snd column
+            repeats = snd_counts[fst_owners]
+            pair_fst = np.repeat(np.arange(len(fst_owners)), repeats)
+            snd_begin = np.cumsum(snd_counts) - snd_counts
+            pair_snd = (
+                np.repeat(snd_begin[fst_owners], repeats)
+                + np.arange(repeats.sum())
+                - np.repeat(np.cumsum(repeats) - repeats, repeats)
+            )
+            targets = fst_cols[pair_fst].astype(np.int64) * m + snd_cols[pair_snd]
+            src.append(frontier[fst_owners[pair_fst]])
+            labels.append(np.full(len(targets), label_id, dtype=np.int64))
+            dst.append(targets)
+
+            targets = np.unique(targets[~visited[targets]])
+            visited[targets] = True
+            next_frontier.append(targets)
+        frontier = np.concatenate(next_frontier) if next_frontier else frontier[:0]
+        discovered.append(frontier)
+
+    states = np.sort(np.concatenate(discovered))
+    intersect_bm = BooleanMatrices(backend=self.backend)
+    intersect_bm.states_count = len(states)
+    intersect_bm.state_indices = {
+        state: index for index, state in enumerate(states.tolist())
+    }
+
+    fst_finals = np.zeros(self.states_count, dtype=bool)
+    fst_finals[self.get_final_indices()] = True
+    snd_finals = np.zeros(m, dtype=bool)
+    snd_finals[other.get_final_indices()] = True
+    intersect_bm.start_states = set(discovered[0].tolist())
+    intersect_bm.final_states = set(
+        states[fst_finals[states // m] & snd_finals[states % m]].tolist()
+    )
+
+    if src:
+        matrices = build_label_matrices(
+            np.searchsorted(states, np.concatenate(src)),
+            np.concatenate(labels),
+            np.searchsorted(states, np.concatenate(dst)),
+            len(states),
+            len(common_symbols),
+        )
+        intersect_bm.bool_matrices = {
+            symbol: convert_matrix(matrix, self.backend)
+            for symbol, matrix in zip(common_symbols, matrices)
+            if matrix.nnz
+        }
 
     return intersect_bm
 
@@ -62,9 +217,9 @@ def convert_bm_to_automaton(boolean_matrices: BooleanMatrices):
             automaton.add_transition(state_from, label, state_to)
 
     for state in boolean_matrices.start_states:
-        automaton.add_start_state(State(state))
+        automaton.add_start_state(State(boolean_matrices.state_indices[state]))
 
     for state in boolean_matrices.final_states:
-        automaton.add_final_state(State(state))
+        automaton.add_final_state(State(boolean_matrices.state_indices[state]))
 
     return automaton
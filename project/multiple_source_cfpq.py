@@ -0,0 +1,254 @@
+from collections import defaultdict, namedtuple
+from typing import Dict, Iterable, Set, Tuple, Union
+
+import networkx as nx
+import numpy as np
+from pyformlang.cfg import CFG, Variable
+from scipy import sparse
+
+from project.graph_index import GraphIndex, as_graph_index
+from project.matrix import new_elements
+from project.wcnf_utils import convert_cfg_to_wcnf
+
+__all__ = ["MultipleSourceCfpq", "ProbeStats"]
+
+ProbeStats = namedtuple("ProbeStats", ["rounds", "finished", "facts"])
+
+
+class MultipleSourceCfpq:
+    """
+    Context-Free Path Querying from given start nodes based on matrix multiplication.
+    Only facts needed for derivations from start nodes are computed:
+    for every variable the set of its sources is kept and its matrix contains
+    rows of these sources only. For production A -> B C sources of A
+    are sources of B, and nodes reached by B from them are sources of C.
+    Computed facts are kept between queries, so a query with sources
+    overlapping the previous ones derives facts of new sources only.
+    It is run by multiple_source_cfpq, plan_cfpq probes it
+    to estimate the cost of matrix algorithms.
+
+    Attributes
+    ----------
+    cfg: CFG
+        Grammar in Weak Chomsky Normal Form
+    start_variable: Variable
+        Start variable in CFG
+    """
+
+    def __init__(
+        self,
+        graph: Union[nx.MultiDiGraph, GraphIndex],
+        cfg: CFG,
+        start_variable: Variable = Variable("S"),
+    ):
+        if not isinstance(start_variable, Variable):
+            start_variable = Variable(start_variable)
+        self.start_variable = start_variable
+        self.cfg = convert_cfg_to_wcnf(
+            CFG(start_symbol=start_variable, productions=cfg.productions)
+        )
+        self._graph = graph
+
+        self._terminal_bodies = defaultdict(set)
+        self._binary_bodies = defaultdict(set)
+        self._eps_heads = set()
+        for p in self.cfg.productions:
+            if not p.body:
+                self._eps_heads.add(p.head.value)
+            elif len(p.body) == 1:
+                self._terminal_bodies[p.head.value].add(p.body[0].value)
+            else:
+                self._binary_bodies[p.head.value].add(
+                    (p.body[0].value, p.body[1].value)
+                )
+        self._nullable = {s.value for s in self.cfg.get_nullable_symbols()}
+
+        # nodes without edges labeled by terminals are only reachable
+        # from themselves by empty paths, they are answered without matrices
+        self._graph_index = as_graph_index(graph, {t.value for t in self.cfg.terminals})
+        n = self._graph_index.number_of_nodes
+        variables = {v.value for v in self.cfg.variables}
+        self._sources = {v: np.zeros(n, dtype=bool) for v in variables}
+        self._matrices = {v: sparse.csr_matrix((n, n), dtype=bool) for v in variables}
+
+    def _selector(self, mask: np.ndarray) -> sparse.csr_matrix:
+        """
+        Diagonal matrix which keeps rows of nodes from mask when multiplied on the left
+        """
+        return sparse.diags(mask, dtype=bool, format="csr")
+
+    def _evaluate(
+        self, source_deltas: Dict[str, np.ndarray], max_rounds: int = None
+    ) -> Tuple[int, bool]:
+        """
+        Derives facts of new sources semi-naively: every round uses only
+        sources and entries found in the previous one,
+        d(S_A @ B @ C) = (dS_A @ B + S_A @ dB) @ C + S_A @ B @ dC.
+        Returns count of rounds made and whether the fixpoint is reached,
+        after max_rounds evaluation stops and facts are incomplete.
+        """
+        deltas = dict()
+        rounds = 0
+        while source_deltas or deltas:
+            if max_rounds is not None and rounds >= max_rounds:
+                return rounds, False
+            rounds += 1
+            new_sources = defaultdict(list)
+            candidates = defaultdict(list)
+
+            for head, sources in source_deltas.items():
+                select = self._selector(sources)
+                for label in self._terminal_bodies[head]:
+                    label_matrix = self._graph_index.csr_matrices.get(label)
+                    if label_matrix is not None:
+                        candidates[head].append(select @ label_matrix)
+                if head in self._eps_heads:
+                    candidates[head].append(select)
+                for left, _ in self._binary_bodies[head]:
+                    new_sources[left].append(sources)
+
+            for head, bodies in self._binary_bodies.items():
+                for left, right in bodies:
+                    if not (head in source_deltas or left in deltas or right in deltas):
+                        continue
+                    select = self._selector(self._sources[head])
+                    left_parts = []
+                    if head in source_deltas:
+                        left_parts.append(
+                            self._selector(source_deltas[head]) @ self._matrices[left]
+                        )
+                    if left in deltas:
+                        left_parts.append(select @ deltas[left])
+                    if left_parts:
+                        left_delta = sum(left_parts[1:], left_parts[0])
+                        new_sources[right].append(
+                            np.asarray(left_delta.sum(axis=0)).ravel() > 0
+                        )
+                        candidates[head].append(left_delta @ self._matrices[right])
+                    if right in deltas:
+                        candidates[head].append(
+                            select @ self._matrices[left] @ deltas[right]
+                        )
+
+            deltas = dict()
+            for head, products in candidates.items():
+                delta = new_elements(
+                    sparse.csr_matrix(sum(products[1:], products[0]), dtype=bool),
+                    self._matrices[head],
+                )
+                if delta.nnz:
+                    deltas[head] = delta
+            for head, delta in deltas.items():
+                self._matrices[head] = self._matrices[head] + delta
+
+            source_deltas = dict()
+            for variable, masks in new_sources.items():
+                sources = np.logical_or.reduce(masks) & ~self._sources[variable]
+                if sources.any():
+                    source_deltas[variable] = sources
+                    self._sources[variable] |= sources
+
+        return rounds, True
+
+    def probe(self, start_nodes: Iterable, max_rounds: int) -> ProbeStats:
+        """
+        Derives facts of start nodes for at most max_rounds rounds
+        of semi-naive evaluation to estimate the cost of a complete one.
+        If the fixpoint is not reached, computed facts are incomplete
+        and the object must not be queried afterwards.
+
+        Parameters
+        ----------
+        start_nodes: Iterable
+            Start nodes of paths
+        max_rounds: int
+            Maximal count of rounds
+
+        Returns
+        -------
+        ProbeStats:
+            count of rounds made, whether the fixpoint is reached
+            and count of facts of every variable derived at start nodes
+
+        Raises
+        ------
+        ValueError
+            If node does not present in the graph
+        """
+        start_nodes = set(start_nodes)
+        for node in start_nodes:
+            if node not in self._graph:
+                raise ValueError(f"\nNode {node} does not present in the graph")
+
+        start = self.start_variable.value
+        if start not in self._sources:
+            return ProbeStats(0, True, {})
+        indices = self._graph_index.get_indices(
+            n for n in start_nodes if n in self._graph_index
+        )
+        sources = np.zeros(self._graph_index.number_of_nodes, dtype=bool)
+        sources[indices] = True
+        sources &= ~self._sources[start]
+        rounds, finished = 0, True
+        if sources.any():
+            self._sources[start] |= sources
+            rounds, finished = self._evaluate({start: sources}, max_rounds)
+        facts = {
+            variable: matrix[indices].nnz for variable, matrix in self._matrices.items()
+        }
+        return ProbeStats(rounds, finished, facts)
+
+    def query(self, start_nodes: Iterable, final_nodes: Iterable = None) -> Set[Tuple]:
+        """
+        Finds pairs of nodes connected by a path derived from the start variable
+
+        Parameters
+        ----------
+        start_nodes: Iterable
+            Start nodes of paths
+        final_nodes: Iterable, default=None
+            Final nodes of paths, all nodes if not specified
+
+        Returns
+        -------
+        Set[Tuple]:
+            set of tuples (node, node)
+
+        Raises
+        ------
+        ValueError
+            If node does not present in the graph
+        """
+        start_nodes = set(start_nodes)
+        final_nodes = None if final_nodes is None else set(final_nodes)
+        for node in start_nodes | (final_nodes or set()):
+            if node not in self._graph:
+                raise ValueError(f"\nNode {node} does not present in the graph")
+
+        start = self.start_variable.value
+        result = {
+            (node, node)
+            for node in start_nodes
+            if node not in self._graph_index
+            and start in self._nullable
+            and (final_nodes is None or node in final_nodes)
+        }
+        if start not in self._sources:
+            return result
+
+        indices = self._graph_index.get_indices(
+            n for n in start_nodes if n in self._graph_index
+        )
+        sources = np.zeros(self._graph_index.number_of_nodes, dtype=bool)
+        sources[indices] = True
+        sources &= ~self._sources[start]
+        if sources.any():
+            self._sources[start] |= sources
+            self._evaluate({start: sources})
+
+        nodes = self._graph_index.nodes
+        pairs = self._matrices[start][indices].tocoo()
+        for u, v in zip(indices[pairs.row], pairs.col):
+            if final_nodes is None or nodes[v] in final_nodes:
+                result.add((nodes[u], nodes[v]))
+        return result
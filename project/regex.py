@@ -1,12 +1,179 @@
-from pyformlang.finite_automaton import DeterministicFiniteAutomaton
+import re
+from collections import OrderedDict, deque, namedtuple
+from threading import Lock
+
+from pyformlang.finite_automaton import DeterministicFiniteAutomaton, State
 from pyformlang.regular_expression import Regex
 
-__all__ = ["regex_to_min_dfa"]
+__all__ = ["regex_to_min_dfa", "RegexCache", "CacheStats", "regex_cache"]
+
+CacheStats = namedtuple(
+    "CacheStats", ["hits", "misses", "evictions", "entries", "elements"]
+)
+
+
+def _compile_min_dfa(regex_str: str) -> DeterministicFiniteAutomaton:
+    regex = Regex(regex_str)
+    enfa = regex.to_epsilon_nfa()
+    dfa = enfa.to_deterministic()
+    min_dfa = dfa.minimize()
+    return _number_states(min_dfa)
+
+
+def _number_states(dfa: DeterministicFiniteAutomaton) -> DeterministicFiniteAutomaton:
+    """
+    Renames states to integers in BFS order from the start state,
+    visiting transitions sorted by symbol. States of minimized DFA are
+    named by sets of states and their transitions are ordered by the hash
+    seed, while is_equivalent_to of pyformlang follows only the first
+    transition of every state, so its result depended on the seed.
+    """
+    if not dfa.start_states:
+        return dfa
+    numbered = DeterministicFiniteAutomaton()
+    indices = {dfa.start_state: 0}
+    queue = deque([dfa.start_state])
+    numbered.add_start_state(State(0))
+    while queue:
+        state = queue.popleft()
+        if state in dfa.final_states:
+            numbered.add_final_state(State(indices[state]))
+        for symbol, next_state in sorted(dfa(state), key=lambda t: str(t[0])):
+            if next_state not in indices:
+                indices[next_state] = len(indices)
+                queue.append(next_state)
+            numbered.add_transition(
+                State(indices[state]), symbol, State(indices[next_state])
+            )
+    return numbered
+
+
+class RegexCache:
+    """
+    LRU cache of minimal DFA compiled from regular expressions.
+    Keys are regular expressions with normalized whitespaces.
+    Size of a DFA is measured in elements: count of its states and transitions.
+
+    Attributes
+    ----------
+    max_entries: int
+        Maximal count of cached automata
+    max_elements: int
+        Maximal total size of cached automata,
+        automaton of bigger size is not cached at all
+    """
+
+    def __init__(self, max_entries: int = 256, max_elements: int = 1_000_000):
+        self.max_entries = max_entries
+        self.max_elements = max_elements
+        self._entries = OrderedDict()
+        self._elements = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def normalize(regex_str: str) -> str:
+        # only spaces separate symbols, other whitespace is part of them
+        return re.sub(" +", " ", regex_str).strip(" ")
+
+    @staticmethod
+    def _size(dfa: DeterministicFiniteAutomaton) -> int:
+        return len(dfa.states) + len(dfa)
+
+    def get(self, regex_str: str) -> DeterministicFiniteAutomaton:
+        """
+        Returns minimal DFA of regular expression, compiles it on cache miss.
+        Returned automaton is shared with other callers and must not be
+        modified, it has to be copied first.
+
+        Parameters
+        ----------
+        regex_str: str
+            String representation of regular expression
+
+        Returns
+        -------
+        DeterministicFiniteAutomaton
+            Minimal DFA of regular expression
+
+        Raises
+        ------
+        MisformedRegexError
+            If the regular expression is misformed.
+        """
+        key = self.normalize(regex_str)
+        with self._lock:
+            if key in self._entries:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self._misses += 1
+
+        dfa = _compile_min_dfa(regex_str)
+        size = self._size(dfa)
+
+        with self._lock:
+            if size <= self.max_elements and key not in self._entries:
+                self._entries[key] = dfa
+                self._elements += size
+                self._shrink()
+        return dfa
+
+    def _shrink(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._elements > self.max_elements
+        ):
+            _, dfa = self._entries.popitem(last=False)
+            self._elements -= self._size(dfa)
+            self._evictions += 1
+
+    def evict(self, regex_str: str) -> bool:
+        """
+        Removes regular expression from cache
+
+        Returns
+        -------
+        bool
+            True if regular expression was cached
+        """
+        with self._lock:
+            dfa = self._entries.pop(self.normalize(regex_str), None)
+            if dfa is None:
+                return False
+            self._elements -= self._size(dfa)
+            self._evictions += 1
+            return True
+
+    def clear(self) -> None:
+        """
+        Removes all cached automata and resets statistics
+        """
+        with self._lock:
+            self._entries.clear()
+            self._elements = 0
+            self._hits = self._misses = self._evictions = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            self._hits,
+            self._misses,
+            self._evictions,
+            len(self._entries),
+            self._elements,
+        )
+
+
+regex_cache = RegexCache()
 
 
 def regex_to_min_dfa(regex_str: str) -> DeterministicFiniteAutomaton:
     """
-    Generates deterministic automata by regular expression
+    Generates deterministic automata by regular expression.
+    Compiled automata are cached in regex_cache and shared between callers,
+    so returned automata must not be modified.
 
     Parameters
     ----------
@@ -23,8 +190,4 @@ def regex_to_min_dfa(regex_str: str) -> DeterministicFiniteAutomaton:
     MisformedRegexError
     If the regular expression is misformed.
     """
-    regex = Regex(regex_str)
-    enfa = regex.to_epsilon_nfa()
-    dfa = enfa.to_deterministic()
-    min_dfa = dfa.minimize()
-    return min_dfa
+    return regex_cache.get(regex_str)
@@ -1,17 +1,63 @@
-from typing import Tuple, Set
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple, Set, Union
 
 import networkx as nx
+import numpy as np
+from scipy import sparse
 
-from project import get_nfa_by_graph, regex_to_min_dfa
-from project.matrix import BooleanMatrices
-from project.matrix_utils import intersect_boolean_matrices
+from project import regex_to_min_dfa
+from project.graph_index import GraphIndex, as_graph_index
+from project.matrix import (
+    BooleanMatrices,
+    IndexRange,
+    convert_matrix,
+    new_elements,
+    SPARSE_BACKEND,
+)
+from project.matrix_utils import intersect_boolean_matrices, KRONECKER_INTERSECTION
 
-__all__ = ["rpq", "get_reachable"]
+__all__ = [
+    "rpq",
+    "rpq_batch",
+    "rpq_iter",
+    "rpq_exists",
+    "get_reachable",
+    "get_reachable_from_sources",
+    "ALL_PAIRS_EVALUATION",
+    "MULTI_SOURCE_EVALUATION",
+    "BIDIRECTIONAL_EVALUATION",
+]
+
+ALL_PAIRS_EVALUATION = "all-pairs"
+MULTI_SOURCE_EVALUATION = "multi-source"
+BIDIRECTIONAL_EVALUATION = "bidirectional"
+_EVALUATIONS = {ALL_PAIRS_EVALUATION, MULTI_SOURCE_EVALUATION, BIDIRECTIONAL_EVALUATION}
+
+# count of start nodes evaluated at once when rpq result is limited
+_LIMIT_BATCH_SIZE = 64
+# maximal count of node pairs checked one by one by bidirectional evaluation:
+# a search which finds no path costs as much as one multiple-source BFS
+# from all start nodes, so only a few pairs are checked separately
+_BIDIRECTIONAL_PAIRS = 4
+
+
+def _unique_pairs(
+    index_from: np.ndarray, index_to: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Removes repeated pairs of non-negative indices, pairs are sorted
+    """
+    if not len(index_from):
+        return index_from, index_to
+    n = int(max(index_from.max(), index_to.max())) + 1
+    keys = np.unique(index_from * n + index_to)
+    return keys // n, keys % n
 
 
 def get_reachable(
-    bmatrix: BooleanMatrices, query_bm: BooleanMatrices = None
-) -> Set[Tuple[int, int]]:
+    bmatrix: BooleanMatrices, query_bm: BooleanMatrices = None, as_set: bool = True
+) -> Union[Set[Tuple[int, int]], Tuple[np.ndarray, np.ndarray]]:
     """
     Parameters
     ----------
@@ -21,64 +67,534 @@ def get_reachable(
     query_bm: BooleanMatrices
         Query boolean matrix object
 
+    as_set: bool, default=True
+        Convert result arrays to the set of pairs
+
     Returns
     -------
-        reachable: Set[Tuple[int, int]]
-            All reachable nodes, according to start and final states
+        reachable: Set[Tuple[int, int]] | Tuple[np.ndarray, np.ndarray]
+            All reachable nodes, according to start and final states.
+            If query_bm is given, states of bmatrix are decoded to the states
+            of the graph intersected with query_bm. If as_set is False,
+            arrays of start and final parts of the pairs are returned,
+            every pair is present once.
     """
     transitive_closure = bmatrix.make_transitive_closure()
+    start_indices = bmatrix.get_start_indices()
+    final_indices = bmatrix.get_final_indices()
 
-    start_states = bmatrix.get_start_states()
-    final_states = bmatrix.get_final_states()
-
-    result_set = set()
-
-    for state_from, state_to in zip(*transitive_closure.nonzero()):
-        if state_from in start_states and state_to in final_states:
-            result_set.add(
-                (
-                    state_from // query_bm.states_count
-                    if query_bm is not None
-                    else bmatrix.states_count,
-                    state_to // query_bm.states_count
-                    if query_bm is not None
-                    else bmatrix.states_count,
-                )
-            )
+    if bmatrix.bool_matrices:
+        reachable = (
+            sparse.csr_matrix(convert_matrix(transitive_closure, SPARSE_BACKEND))[
+                start_indices
+            ][:, final_indices]
+        ).tocoo()
+        index_from, index_to = (
+            start_indices[reachable.row],
+            final_indices[reachable.col],
+        )
+    else:
+        index_from = index_to = np.array([], dtype=np.int64)
+
+    states = bmatrix.get_index_states()
+    if isinstance(states, IndexRange):
+        state_from, state_to = index_from, index_to
+    else:
+        index_states = np.empty(bmatrix.states_count, dtype=object)
+        index_states[:] = [states[index] for index in range(bmatrix.states_count)]
+        if query_bm is not None:
+            # states of an intersection are integers i * query_bm.states_count + j
+            index_states = index_states.astype(np.int64)
+        state_from, state_to = index_states[index_from], index_states[index_to]
+
+    if query_bm is not None:
+        # pair of graph states is reached in every final state of query
+        state_from, state_to = _unique_pairs(
+            state_from // query_bm.states_count,
+            state_to // query_bm.states_count,
+        )
+
+    if as_set:
+        return set(zip(state_from.tolist(), state_to.tolist()))
+    return state_from, state_to
+
+
+def get_reachable_from_sources(
+    graph_bm: BooleanMatrices, query_bm: BooleanMatrices, as_set: bool = True
+) -> Union[Set[Tuple[int, int]], Tuple[np.ndarray, np.ndarray]]:
+    """
+    Multiple-source BFS over the product of graph and query.
+    Front is a sparse matrix with a row for every pair (source, query state)
+    and a column for every graph state. On every step it is multiplied by
+    the graph matrix of each label and its rows are moved along the query
+    transitions by the same label, until no new pairs are found.
+    Cost is proportional to the part of the product reachable from the sources.
+
+    Parameters
+    ----------
+    graph_bm: BooleanMatrices
+        Boolean matrices of graph, its start states are the sources
+    query_bm: BooleanMatrices
+        Boolean matrices of query
+    as_set: bool, default=True
+        Convert result arrays to the set of pairs
+
+    Returns
+    -------
+        reachable: Set[Tuple[int, int]] | Tuple[np.ndarray, np.ndarray]
+            Pairs (graph start index, graph final index) connected
+            by a non-empty path accepted by query
+    """
+    sources = graph_bm.get_start_indices()
+    query_starts = query_bm.get_start_indices()
+    k, m, n = len(sources), query_bm.states_count, graph_bm.states_count
+
+    labels = graph_bm.bool_matrices.keys() & query_bm.bool_matrices.keys()
+    if not k or not labels or not len(query_starts):
+        empty = np.array([], dtype=np.int64)
+        return set() if as_set else (empty, empty)
+
+    steps = [
+        (
+            sparse.csr_matrix(
+                convert_matrix(graph_bm.bool_matrices[label], SPARSE_BACKEND)
+            ),
+            sparse.kron(
+                sparse.identity(k, dtype=bool),
+                convert_matrix(query_bm.bool_matrices[label], SPARSE_BACKEND).T,
+                format="csr",
+            ),
+        )
+        for label in labels
+    ]
+
+    def step(front):
+        return sparse.csr_matrix(
+            sum(moves @ (front @ graph_matrix) for graph_matrix, moves in steps),
+            dtype=bool,
+        )
+
+    rows = (np.arange(k)[:, None] * m + query_starts[None, :]).ravel()
+    cols = np.repeat(sources, len(query_starts))
+    front = step(
+        sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(k * m, n)
+        )
+    )
+    visited = front
+    while front.nnz:
+        front = new_elements(step(front), visited)
+        visited = visited + front
+
+    query_finals = np.zeros(m, dtype=bool)
+    query_finals[query_bm.get_final_indices()] = True
+    graph_finals = np.zeros(n, dtype=bool)
+    graph_finals[graph_bm.get_final_indices()] = True
+
+    visited = visited.tocoo()
+    mask = query_finals[visited.row % m] & graph_finals[visited.col]
+    index_from = sources[visited.row[mask] // m]
+    index_to = visited.col[mask].astype(np.int64)
+
+    if as_set:
+        return set(zip(index_from.tolist(), index_to.tolist()))
+    return index_from, index_to
+
+
+def _query_graph(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    query_bm: BooleanMatrices,
+    start_nodes: set = None,
+    final_nodes: set = None,
+) -> Tuple[GraphIndex, BooleanMatrices]:
+    """
+    Builds graph index restricted to the labels of query and its boolean matrices.
+    Start and final nodes without incident edges of these labels are dropped,
+    as they can not be the ends of a non-empty path accepted by query.
+
+    Raises
+    ------
+    ValueError
+        If node does not present in the graph
+    """
+    for node in (start_nodes or set()) | (final_nodes or set()):
+        if node not in graph:
+            raise ValueError(f"\nNode {node} does not present in the graph")
+
+    graph_index = as_graph_index(graph, query_bm.bool_matrices.keys())
+
+    def kept(nodes):
+        return None if nodes is None else {n for n in nodes if n in graph_index}
+
+    return graph_index, graph_index.to_boolean_matrices(
+        kept(start_nodes), kept(final_nodes)
+    )
+
+
+def _search_steps(graph_index: GraphIndex, query_bm: BooleanMatrices) -> Tuple:
+    """
+    Pairs (query moves, graph matrix) for every common label, used by
+    _bidirectional_search to move forward and backward fronts.
+    Built once to be shared between searches over the same graph and query.
+    """
+    labels = graph_index.labels & query_bm.bool_matrices.keys()
+    query_matrices = {
+        label: sparse.csr_matrix(
+            convert_matrix(query_bm.bool_matrices[label], SPARSE_BACKEND)
+        )
+        for label in labels
+    }
+    forward_steps = [
+        (query_matrices[label].T, graph_index.csr_matrices[label]) for label in labels
+    ]
+    backward_steps = [
+        (query_matrices[label], graph_index.csc_matrices[label].T) for label in labels
+    ]
+    return forward_steps, backward_steps
+
+
+def _bidirectional_search(
+    graph_index: GraphIndex,
+    query_bm: BooleanMatrices,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    steps: Tuple = None,
+) -> bool:
+    """
+    Checks that some target is reachable from some source by a non-empty path
+    accepted by query. Forward front (query state x graph node) is moved along
+    the label matrices from the sources, backward front is moved along the
+    transposed label matrices from the targets, the smaller one is expanded
+    on every step. Search stops as soon as the visited states intersect.
+    Steps are built by _search_steps if not given.
+    """
+    m, n = query_bm.states_count, graph_index.number_of_nodes
+    forward_steps, backward_steps = steps or _search_steps(graph_index, query_bm)
+    query_starts = query_bm.get_start_indices()
+    query_finals = query_bm.get_final_indices()
+    if not (forward_steps and len(sources) and len(targets)):
+        return False
+    if not (len(query_starts) and len(query_finals)):
+        return False
+
+    def states(query_states, graph_states):
+        rows = np.repeat(query_states, len(graph_states))
+        cols = np.tile(graph_states, len(query_states))
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(m, n)
+        )
+
+    def step(front, steps):
+        return sparse.csr_matrix(
+            sum(moves @ (front @ graph_matrix) for moves, graph_matrix in steps),
+            dtype=bool,
+        )
+
+    # forward states are reached by at least one edge, so a meeting
+    # with backward states always gives a non-empty path
+    forward = step(states(query_starts, sources), forward_steps)
+    backward = states(query_finals, targets)
+    forward_visited, backward_visited = forward, backward
+
+    while forward.nnz and backward.nnz:
+        if forward_visited.multiply(backward_visited).nnz:
+            return True
+        if forward.nnz <= backward.nnz:
+            forward = new_elements(step(forward, forward_steps), forward_visited)
+            forward_visited = forward_visited + forward
+        else:
+            backward = new_elements(step(backward, backward_steps), backward_visited)
+            backward_visited = backward_visited + backward
+
+    return bool(forward_visited.multiply(backward_visited).nnz)
+
+
+def rpq_exists(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    query: str,
+    start_nodes: set = None,
+    final_nodes: set = None,
+) -> bool:
+    """
+    Checks that some final node is reachable from some start node
+    by a non-empty path accepted by the regular expression.
+    Bidirectional search is used, it stops at the first witness.
+
+    Parameters
+    ----------
+    graph: MultiDiGraph | GraphIndex
+       Labeled graph or its prebuilt index
+    query: str
+       Regular expression given as string
+    start_nodes: set, default=None
+       Start nodes, all nodes if not specified
+    final_nodes: set, default=None
+       Final nodes, all nodes if not specified
+
+    Returns
+    -------
+    exists: bool
+       True if result of rpq is not empty
 
-    return result_set
+    Raises
+    ------
+    ValueError
+        If node does not present in the graph
+    """
+    query_bm = BooleanMatrices(regex_to_min_dfa(query))
+    graph_index, graph_bm = _query_graph(graph, query_bm, start_nodes, final_nodes)
+    return _bidirectional_search(
+        graph_index,
+        query_bm,
+        graph_bm.get_start_indices(),
+        graph_bm.get_final_indices(),
+    )
+
+
+def _iter_pairs(
+    graph_index: GraphIndex,
+    graph_bm: BooleanMatrices,
+    query_bm: BooleanMatrices,
+    batch_size: int,
+) -> Iterator[Tuple[int, int]]:
+    """
+    Runs multiple-source BFS for batches of start states of graph_bm
+    and yields pairs of nodes found for every batch
+    """
+    sources = graph_bm.get_start_indices()
+    for begin in range(0, len(sources), batch_size):
+        graph_bm.start_states = set(sources[begin : begin + batch_size].tolist())
+        index_from, index_to = get_reachable_from_sources(
+            graph_bm, query_bm, as_set=False
+        )
+        # pair is found once for every final query state, sources of batches
+        # are disjoint, so pairs are unique if they are unique in every batch
+        index_from, index_to = _unique_pairs(index_from, index_to)
+        yield from zip(
+            graph_index.nodes[index_from].tolist(),
+            graph_index.nodes[index_to].tolist(),
+        )
 
 
 def rpq(
-    graph: nx.MultiDiGraph,
+    graph: Union[nx.MultiDiGraph, GraphIndex],
     query: str,
     start_nodes: set = None,
     final_nodes: set = None,
+    intersection_mode: str = KRONECKER_INTERSECTION,
+    evaluation: str = ALL_PAIRS_EVALUATION,
+    limit: int = None,
+    exists_only: bool = False,
 ):
     """
     Computes Regular Path Querying from given graph and regular expression
 
     Parameters
     ----------
-    graph: MultiDiGraph
-       Labeled graph
+    graph: MultiDiGraph | GraphIndex
+       Labeled graph or its prebuilt index
     query: str
        Regular expression given as string
     start_nodes: set, default=None
-       Start states in NFA
+       Start nodes, all nodes if not specified
+    final_nodes: set, default=None
+       Final nodes, all nodes if not specified
+    intersection_mode: str, default=KRONECKER_INTERSECTION
+       Mode of intersect_boolean_matrices for the graph and the query
+    evaluation: str, default=ALL_PAIRS_EVALUATION
+       ALL_PAIRS_EVALUATION closes the whole intersection,
+       MULTI_SOURCE_EVALUATION runs BFS from start nodes only
+       (see get_reachable_from_sources),
+       BIDIRECTIONAL_EVALUATION checks every pair of start and final nodes
+       by bidirectional search (see rpq_exists) and suits small sets of nodes,
+       it falls back to MULTI_SOURCE_EVALUATION if there are many pairs,
+       intersection_mode is not used by the last two
+    limit: int, default=None
+       Maximal count of returned pairs. Start nodes are evaluated in batches
+       as in rpq_iter until enough pairs are found, evaluation is not used then
+    exists_only: bool, default=False
+       Return only whether the result is not empty,
+       bidirectional search stops at the first witness (see rpq_exists)
+
+    Returns
+    -------
+    result_set: set | bool
+       Regular Path Querying, or bool if exists_only
+
+    Raises
+    ------
+    ValueError
+        If evaluation is unknown, limit is negative
+        or node does not present in the graph
+    """
+    if evaluation not in _EVALUATIONS:
+        raise ValueError(f"Unknown evaluation mode '{evaluation}'")
+    if limit is not None and limit < 0:
+        raise ValueError("Limit must be non-negative")
+
+    query_bm = BooleanMatrices(regex_to_min_dfa(query))
+    graph_index, graph_bm = _query_graph(graph, query_bm, start_nodes, final_nodes)
+
+    if exists_only:
+        return _bidirectional_search(
+            graph_index,
+            query_bm,
+            graph_bm.get_start_indices(),
+            graph_bm.get_final_indices(),
+        )
+    if limit is not None:
+        return set(
+            islice(
+                _iter_pairs(graph_index, graph_bm, query_bm, _LIMIT_BATCH_SIZE),
+                limit,
+            )
+        )
+
+    if evaluation == MULTI_SOURCE_EVALUATION:
+        index_from, index_to = get_reachable_from_sources(
+            graph_bm, query_bm, as_set=False
+        )
+    elif evaluation == ALL_PAIRS_EVALUATION:
+        intersected_bm = intersect_boolean_matrices(
+            graph_bm, query_bm, intersection_mode
+        )
+        index_from, index_to = get_reachable(intersected_bm, query_bm, as_set=False)
+    else:
+        sources = graph_bm.get_start_indices()
+        targets = graph_bm.get_final_indices()
+        if len(sources) * len(targets) > _BIDIRECTIONAL_PAIRS:
+            index_from, index_to = get_reachable_from_sources(
+                graph_bm, query_bm, as_set=False
+            )
+        else:
+            steps = _search_steps(graph_index, query_bm)
+            pairs = [
+                (source, target)
+                for source in sources
+                for target in targets
+                if _bidirectional_search(
+                    graph_index,
+                    query_bm,
+                    np.array([source]),
+                    np.array([target]),
+                    steps,
+                )
+            ]
+            index_from = np.array([source for source, _ in pairs], dtype=np.int64)
+            index_to = np.array([target for _, target in pairs], dtype=np.int64)
+
+    return set(
+        zip(
+            graph_index.nodes[index_from].tolist(),
+            graph_index.nodes[index_to].tolist(),
+        )
+    )
+
+
+def rpq_iter(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    query: str,
+    start_nodes: set = None,
+    final_nodes: set = None,
+    batch_size: int = 64,
+) -> Iterator[Tuple[int, int]]:
+    """
+    Computes Regular Path Querying lazily: start nodes are split into batches,
+    multiple-source BFS (see get_reachable_from_sources) is run for one batch
+    at a time and its pairs are yielded before the next batch is evaluated.
+    Every pair is yielded once.
+
+    Parameters
+    ----------
+    graph: MultiDiGraph | GraphIndex
+       Labeled graph or its prebuilt index
+    query: str
+       Regular expression given as string
+    start_nodes: set, default=None
+       Start nodes, all nodes if not specified
+    final_nodes: set, default=None
+       Final nodes, all nodes if not specified
+    batch_size: int, default=64
+       Count of start nodes evaluated at once
+
+    Returns
+    -------
+    pairs: Iterator[Tuple[int, int]]
+       Pairs of nodes, same as in the result of rpq
+
+    Raises
+    ------
+    ValueError
+        If batch_size is not positive or node does not present in the graph
+    """
+    if batch_size < 1:
+        raise ValueError("Batch size must be positive")
+
+    query_bm = BooleanMatrices(regex_to_min_dfa(query))
+    graph_index, graph_bm = _query_graph(graph, query_bm, start_nodes, final_nodes)
+
+    # arguments are checked on call, evaluation is deferred to iteration
+    return _iter_pairs(graph_index, graph_bm, query_bm, batch_size)
+
+
+_batch_context = dict()
+
+
+def _init_batch_worker(graph_index: GraphIndex, kwargs: dict):
+    _batch_context["graph_index"] = graph_index
+    _batch_context["kwargs"] = kwargs
+
+
+def _rpq_batch_worker(query: str) -> Set[Tuple[int, int]]:
+    return rpq(_batch_context["graph_index"], query, **_batch_context["kwargs"])
+
+
+def rpq_batch(
+    graph: Union[nx.MultiDiGraph, GraphIndex],
+    queries: Iterable[str],
+    start_nodes: set = None,
+    final_nodes: set = None,
+    workers: int = None,
+    evaluation: str = ALL_PAIRS_EVALUATION,
+) -> List[Set[Tuple[int, int]]]:
+    """
+    Computes Regular Path Querying for many regular expressions over one graph.
+    Graph matrices are built once and passed to every worker process
+    of the pool on its start, queries are evaluated in parallel.
+
+    Parameters
+    ----------
+    graph: MultiDiGraph | GraphIndex
+       Labeled graph or its prebuilt index
+    queries: Iterable[str]
+       Regular expressions given as strings
+    start_nodes: set, default=None
+       Start nodes, all nodes if not specified
     final_nodes: set, default=None
-       Final states in NFA
+       Final nodes, all nodes if not specified
+    workers: int, default=None
+       Count of worker processes, os.cpu_count() if not specified.
+       Queries are evaluated in the current process if it is 1
+    evaluation: str, default=ALL_PAIRS_EVALUATION
+       Evaluation mode of rpq
 
     Returns
     -------
-    result_set: set
-       Regular Path Querying
+    results: List[set]
+       Result of rpq for every query, in the order of queries
     """
-    nfa_by_graph = get_nfa_by_graph(graph, start_nodes, final_nodes)
-    dfa_by_graph = regex_to_min_dfa(query)
+    graph_index = as_graph_index(graph)
+    queries = list(queries)
+    kwargs = dict(
+        start_nodes=start_nodes, final_nodes=final_nodes, evaluation=evaluation
+    )
 
-    graph_bm = BooleanMatrices(nfa_by_graph)
-    query_bm = BooleanMatrices(dfa_by_graph)
+    if workers == 1 or len(queries) <= 1:
+        return [rpq(graph_index, query, **kwargs) for query in queries]
 
-    intersected_bm = intersect_boolean_matrices(graph_bm, query_bm)
-    return get_reachable(intersected_bm, query_bm)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_batch_worker,
+        initargs=(graph_index, kwargs),
+    ) as executor:
+        return list(executor.map(_rpq_batch_worker, queries))
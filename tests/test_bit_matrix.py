@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from cfpq_data import labeled_cycle_graph
+from pyformlang.cfg import CFG
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton
+from scipy import sparse
+
+from project import (
+    BitMatrix,
+    BooleanMatrices,
+    BITPACKED_BACKEND,
+    create_two_cycles_graph,
+    matrix_cfpq,
+)
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (5, 7), (70, 130), (129, 64)])
+def test_pack_unpack(shape):
+    expected = sparse.random(*shape, density=0.2, format="csr", random_state=42) != 0
+    actual = BitMatrix.from_sparse(expected)
+
+    assert actual.nnz == expected.nnz
+    assert (actual.to_sparse() != expected).nnz == 0
+
+
+@pytest.mark.parametrize("n, k, m", [(3, 3, 3), (17, 70, 9), (100, 130, 65)])
+def test_four_russians_multiplication(n, k, m):
+    lhs = sparse.random(n, k, density=0.1, format="csr", random_state=1) != 0
+    rhs = sparse.random(k, m, density=0.1, format="csr", random_state=2) != 0
+
+    actual = BitMatrix.from_sparse(lhs) @ BitMatrix.from_sparse(rhs)
+
+    assert np.array_equal(actual.toarray(), (lhs @ rhs).toarray())
+
+
+def test_item_access():
+    bm = BitMatrix((3, 100))
+    bm[2, 99] = True
+    bm[0, 64] = True
+    bm[0, 64] = False
+
+    assert bm[2, 99] and not bm[0, 64] and bm.nnz == 1
+
+
+def test_bitpacked_transitive_closure():
+    nfa = NondeterministicFiniteAutomaton()
+    nfa.add_transitions([(0, "a", 1), (1, "b", 2), (2, "a", 0), (3, "a", 3)])
+
+    sparse_tc = BooleanMatrices(nfa).make_transitive_closure()
+    bitpacked_tc = BooleanMatrices(nfa, BITPACKED_BACKEND).make_transitive_closure()
+
+    assert isinstance(bitpacked_tc, BitMatrix)
+    assert np.array_equal(bitpacked_tc.toarray(), sparse_tc.toarray() != 0)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        BooleanMatrices(backend="dense")
+
+
+@pytest.mark.parametrize(
+    "cfg, graph",
+    [
+        ("S -> a S | epsilon", labeled_cycle_graph(3, "a", verbose=False)),
+        (
+            """
+            S -> A B
+            S -> A S1
+            S1 -> S B
+            A -> a
+            B -> b
+            """,
+            create_two_cycles_graph(2, 1, ("a", "b")),
+        ),
+    ],
+)
+def test_bitpacked_cfpq(cfg, graph):
+    assert matrix_cfpq(
+        graph, CFG.from_text(cfg), backend=BITPACKED_BACKEND
+    ) == matrix_cfpq(graph, CFG.from_text(cfg))
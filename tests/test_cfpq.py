@@ -5,12 +5,33 @@ import pytest
 from cfpq_data import labeled_cycle_graph
 from pyformlang.cfg import CFG
 
-from project import create_two_cycles_graph, matrix_cfpq, hellings_cfpq, tensor_cfpq
+from project import (
+    convert_cfg_to_ecfg,
+    convert_ecfg_to_rsm,
+    create_two_cycles_graph,
+    gll_descriptors,
+    matrix_cfpq,
+    hellings_cfpq,
+    tensor_cfpq,
+    gll_cfpq,
+    multiple_source_cfpq,
+    plan_cfpq,
+    cfpq as planned_cfpq,
+)
 
 Config = namedtuple("Config", ["start_var", "start_nodes", "final_nodes", "exp_ans"])
 
 
-@pytest.fixture(params=[matrix_cfpq, hellings_cfpq, tensor_cfpq])
+@pytest.fixture(
+    params=[
+        matrix_cfpq,
+        hellings_cfpq,
+        tensor_cfpq,
+        gll_cfpq,
+        multiple_source_cfpq,
+        planned_cfpq,
+    ]
+)
 def cfpq(request):
     return request.param
 
@@ -73,3 +94,81 @@ def test_cfpq(cfpq, cfg, graph, confs):
         == conf.exp_ans
         for conf in confs
     )
+
+
+@pytest.mark.parametrize("limit", [0, 1, 4, 100])
+def test_cfpq_limit(cfpq, limit):
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    cfg = CFG.from_text("S -> a S b | a b")
+    full = cfpq(graph, cfg)
+
+    actual = cfpq(graph, cfg, limit=limit)
+
+    assert actual <= full and len(actual) == min(limit, len(full))
+
+
+@pytest.mark.parametrize(
+    "start_nodes, final_nodes, expected", [(None, None, True), ({4}, {0}, False)]
+)
+def test_cfpq_exists_only(cfpq, start_nodes, final_nodes, expected):
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    cfg = CFG.from_text("S -> a S b | a b")
+
+    assert cfpq(graph, cfg, start_nodes, final_nodes, exists_only=True) is expected
+
+
+def test_cfpq_negative_limit(cfpq):
+    with pytest.raises(ValueError):
+        cfpq(
+            create_two_cycles_graph(1, 1, ("a", "b")), CFG.from_text("S -> a"), limit=-1
+        )
+
+
+@pytest.mark.parametrize(
+    "cfg",
+    [
+        "S -> S S | a | epsilon",
+        "S -> a S b S | epsilon",
+        "S -> A A\nA -> a | b",
+        "S -> A B | T b\nT -> A B | T T\nA -> a\nB -> b | a",
+    ],
+)
+def test_cfpq_loops_and_parallel_edges(cfpq, cfg):
+    graph = labeled_cycle_graph(3, "a", verbose=False)
+    graph.add_edge(0, 0, label="b")
+    graph.add_edge(0, 1, label="b")
+
+    assert cfpq(graph, CFG.from_text(cfg)) == matrix_cfpq(graph, CFG.from_text(cfg))
+
+
+def test_plan_cfpq():
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    cfg = CFG.from_text("S -> a S b | a b")
+
+    plan = plan_cfpq(graph, cfg, {0})
+
+    assert (plan.algorithm, plan.backend) == min(plan.estimates, key=plan.estimates.get)
+    assert plan.statistics["sources"] == 1
+    assert plan.statistics["nodes"] == 6
+
+
+def test_gll_descriptors():
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    cfg = CFG.from_text("S -> a S b | a b")
+    rsm = convert_ecfg_to_rsm(convert_cfg_to_ecfg(cfg)).minimize()
+
+    descriptors = gll_descriptors(graph, rsm, {0})
+    assert 0 < descriptors <= gll_descriptors(graph, rsm)
+    assert gll_descriptors(graph, rsm, {0}, max_descriptors=5) == 5
+
+
+def test_cfpq_by_every_plan():
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    cfg = CFG.from_text("S -> a S b | a b")
+    plan = plan_cfpq(graph, cfg)
+
+    for algorithm, backend in plan.estimates:
+        forced = plan._replace(algorithm=algorithm, backend=backend)
+        assert planned_cfpq(graph, cfg, {0, 1}, plan=forced) == hellings_cfpq(
+            graph, cfg, {0, 1}
+        )
@@ -0,0 +1,104 @@
+import networkx as nx
+import pytest
+from pyformlang.cfg import CFG
+
+from project import (
+    GraphIndex,
+    as_graph_index,
+    create_two_cycles_graph,
+    rpq,
+    hellings_cfpq,
+    matrix_cfpq,
+    tensor_cfpq,
+    gll_cfpq,
+)
+
+
+@pytest.fixture
+def graph():
+    graph = nx.MultiDiGraph()
+    graph.add_edges_from(
+        [
+            ("x", "y", {"label": "a"}),
+            ("y", "z", {"label": "b"}),
+            ("y", "z", {"label": "a"}),
+            ("z", "x", {"label": "b"}),
+        ]
+    )
+    return graph
+
+
+def test_index_structure(graph):
+    index = GraphIndex(graph)
+
+    assert list(index.nodes) == ["x", "y", "z"]
+    assert index.label_stats == {"a": 2, "b": 2}
+    assert index.number_of_edges == 4
+    assert index.csr_matrices["a"][index.node_indices["y"], index.node_indices["z"]]
+    assert (index.csc_matrices["b"] != index.csr_matrices["b"]).nnz == 0
+
+
+def test_restrict(graph):
+    graph.add_edge("w", "x", label="c")
+    index = GraphIndex(graph).restrict({"c", "d"})
+
+    assert list(index.nodes) == ["x", "w"]
+    assert index.label_stats == {"c": 1}
+    assert index.csr_matrices["c"][index.node_indices["w"], index.node_indices["x"]]
+
+
+@pytest.mark.parametrize("labels", [{"c", "d"}, {"a"}, {"a", "b", "c"}])
+def test_as_graph_index_labels(graph, labels):
+    graph.add_edge("w", "x", label="c")
+    expected = GraphIndex(graph).restrict(labels)
+
+    index = as_graph_index(graph, labels)
+
+    assert list(index.nodes) == list(expected.nodes)
+    assert index.label_stats == expected.label_stats
+    assert all(
+        (index.csr_matrices[label] != matrix).nnz == 0
+        for label, matrix in expected.csr_matrices.items()
+    )
+
+
+def test_pruned_start_nodes(graph):
+    graph.add_edge("w", "x", label="c")
+
+    assert rpq(graph, "b", {"w", "y"}) == {("y", "z")}
+    assert rpq(graph, "c", {"y"}) == set()
+
+
+def test_rpq_by_index(graph):
+    index = GraphIndex(graph)
+
+    assert rpq(index, "a a", {"x"}, {"z"}) == rpq(graph, "a a", {"x"}, {"z"})
+    assert rpq(index, "a a", {"x"}, {"z"}) == {("x", "z")}
+
+
+def test_unknown_node(graph):
+    with pytest.raises(ValueError):
+        rpq(GraphIndex(graph), "a", {"w"})
+
+
+@pytest.mark.parametrize("cfpq", [hellings_cfpq, matrix_cfpq, tensor_cfpq, gll_cfpq])
+def test_cfpq_by_index(cfpq):
+    graph = create_two_cycles_graph(2, 1, ("a", "b"))
+    cfg = """
+        S -> A B
+        S -> A S1
+        S1 -> S B
+        A -> a
+        B -> b
+        """
+    index = GraphIndex(graph)
+
+    assert cfpq(index, CFG.from_text(cfg)) == cfpq(graph, CFG.from_text(cfg))
+    assert cfpq(index, CFG.from_text(cfg)) == {
+        (0, 0),
+        (0, 3),
+        (2, 0),
+        (2, 3),
+        (1, 0),
+        (1, 3),
+    }
@@ -10,7 +10,11 @@ from project.graph_utils import (
     get_graph_info_util,
     save_to_dot,
 )
-from project.graph_funcs import create_two_cycles_graph, get_nfa_by_graph
+from project.graph_funcs import (
+    create_two_cycles_graph,
+    get_edge_arrays,
+    get_nfa_by_graph,
+)
 
 
 def test_get_graph_info():
@@ -141,3 +145,41 @@ def test_one_node_and_edge_graph_to_nfa():
     expected_nfa.add_transition(State(0), Symbol("X"), State(0))
 
     assert actual_nfa.is_equivalent_to(expected_nfa)
+
+
+@pytest.fixture
+def parallel_edges_graph() -> nx.MultiDiGraph:
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(["x", "y", "z"])
+    graph.add_edges_from(
+        [
+            ("x", "y", {"label": "a"}),
+            ("x", "y", {"label": "b"}),
+            ("y", "z", {"label": "c"}),
+        ]
+    )
+    return graph
+
+
+def test_parallel_edges_to_nfa(parallel_edges_graph):
+    nfa = get_nfa_by_graph(parallel_edges_graph)
+
+    assert nfa.accepts(["a", "c"]) and nfa.accepts(["b", "c"])
+
+
+@pytest.mark.parametrize(
+    "labels, expected_edges",
+    [
+        (None, {("x", "a", "y"), ("x", "b", "y"), ("y", "c", "z")}),
+        ({"b", "c", "d"}, {("x", "b", "y"), ("y", "c", "z")}),
+        (set(), set()),
+    ],
+)
+def test_get_edge_arrays(parallel_edges_graph, labels, expected_edges):
+    edges = get_edge_arrays(parallel_edges_graph, labels)
+
+    assert edges.nodes.tolist() == ["x", "y", "z"]
+    assert {
+        (edges.nodes[u], edges.labels[label_id], edges.nodes[v])
+        for u, label_id, v in zip(edges.src, edges.label_ids, edges.dst)
+    } == expected_edges
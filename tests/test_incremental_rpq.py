@@ -0,0 +1,82 @@
+import random
+
+import networkx as nx
+import pytest
+
+from project import IncrementalRpq, create_two_cycles_graph, rpq
+
+
+def _edges(graph):
+    return [(u, label, v) for u, v, label in graph.edges(data="label")]
+
+
+def _graph_of(nodes, edges):
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(nodes)
+    for u, label, v in edges:
+        graph.add_edge(u, v, label=label)
+    return graph
+
+
+@pytest.mark.parametrize("query", ["a*", "a* b", "(a | b) b*", "c"])
+def test_updates_match_recomputation(query):
+    graph = create_two_cycles_graph(4, 3, ("a", "b"))
+    edges = _edges(graph)
+    maintained = IncrementalRpq(graph, query)
+    assert maintained.reachable == rpq(graph, query)
+
+    rng = random.Random(7)
+    nodes = list(graph.nodes)
+    for _ in range(10):
+        removed = rng.sample(edges, 2)
+        for edge in removed:
+            edges.remove(edge)
+        added = [
+            (rng.choice(nodes), rng.choice("ab"), rng.choice(nodes)) for _ in range(2)
+        ]
+        edges.extend(added)
+
+        maintained.remove_edges(removed)
+        maintained.add_edges(added)
+
+        assert maintained.reachable == rpq(_graph_of(nodes, edges), query)
+
+
+def test_parallel_edges():
+    graph = _graph_of([0, 1], [(0, "a", 1), (0, "a", 1)])
+    maintained = IncrementalRpq(graph, "a")
+
+    maintained.remove_edge(0, "a", 1)
+    assert maintained.reachable == {(0, 1)}
+
+    maintained.remove_edge(0, "a", 1)
+    assert maintained.reachable == set()
+
+
+def test_new_nodes_and_start_final_nodes():
+    graph = _graph_of([0, 1], [(0, "a", 1)])
+    maintained = IncrementalRpq(graph, "a*", start_nodes={0}, final_nodes={2})
+    assert maintained.reachable == set()
+
+    maintained.add_edge(1, "a", 2)
+    assert maintained.reachable == {(0, 2)}
+
+
+def test_remove_absent_edge():
+    maintained = IncrementalRpq(_graph_of([0, 1], [(0, "a", 1)]), "a")
+
+    with pytest.raises(ValueError):
+        maintained.remove_edge(1, "a", 0)
+
+
+def test_remove_edges_checks_whole_batch():
+    graph = _graph_of([0, 1, 2], [(0, "a", 1), (1, "a", 2), (1, "a", 2)])
+    maintained = IncrementalRpq(graph, "a a")
+
+    for batch in [[(0, "a", 1), (2, "a", 0)], [(1, "a", 2)] * 3]:
+        with pytest.raises(ValueError):
+            maintained.remove_edges(batch)
+        assert maintained.reachable == {(0, 2)}
+
+    maintained.remove_edges([(1, "a", 2)] * 2)
+    assert maintained.reachable == set()
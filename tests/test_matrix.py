@@ -1,7 +1,13 @@
 import pytest
+from pyformlang.cfg import CFG
 from pyformlang.finite_automaton import NondeterministicFiniteAutomaton
 
-from project import BooleanMatrices
+from project import (
+    BooleanMatrices,
+    SCC_CLOSURE,
+    convert_cfg_to_ecfg,
+    convert_ecfg_to_rsm,
+)
 
 
 @pytest.fixture
@@ -59,3 +65,78 @@ def test_transitive_closure(nfa):
     bm = BooleanMatrices(nfa)
     tc = bm.make_transitive_closure()
     assert tc.sum() == tc.size
+
+
+def test_from_edge_arrays():
+    bm = BooleanMatrices.from_edge_arrays(
+        [0, 0, 1, 2, 2], ["a", "b", "a", "b", "b"], [1, 2, 2, 0, 0], 3
+    )
+
+    assert bm.bool_matrices.keys() == {"a", "b"}
+    assert bm.bool_matrices["a"].nnz == 2
+    assert bm.bool_matrices["b"].nnz == 2
+    assert bm.bool_matrices["b"][2, 0] and not bm.bool_matrices["a"][2, 0]
+    assert bm.start_states == bm.final_states == {0, 1, 2}
+
+
+def test_from_edge_arrays_start_states_only():
+    bm = BooleanMatrices.from_edge_arrays([0], ["a"], [1], 3, start_states={0})
+
+    assert bm.start_states == {0}
+    assert bm.final_states == {0, 1, 2}
+
+
+def test_from_edge_arrays_inconsistent_lengths():
+    with pytest.raises(ValueError):
+        BooleanMatrices.from_edge_arrays([0, 1], ["a"], [1, 0], 2)
+
+
+def test_from_rsm_states():
+    cfg = CFG.from_text("S -> a S b | c\nA -> a")
+    bm = BooleanMatrices.from_rsm(convert_ecfg_to_rsm(convert_cfg_to_ecfg(cfg)))
+
+    heads = bm.states_to_box_variable
+    assert set(bm.get_start_indices()) == {start for start, _ in heads}
+    assert set(bm.get_final_indices()) == {final for _, final in heads}
+    assert sorted(heads.values()) == ["A", "S"]
+    assert bm.restrict({"a"}).start_states == bm.start_states
+
+
+def test_transitive_closure_stats(nfa):
+    bm = BooleanMatrices(nfa)
+    tc = bm.make_transitive_closure()
+
+    assert bm.closure_stats.iterations == len(bm.closure_stats.nnz_history) - 1
+    assert bm.closure_stats.nnz_history[0] == 7
+    assert bm.closure_stats.nnz_history[-1] == tc.nnz == 25
+
+
+@pytest.mark.parametrize(
+    "transitions",
+    [
+        [(0, "a", 1), (1, "a", 2), (2, "b", 0), (2, "a", 3), (3, "b", 4), (5, "a", 5)],
+        [(0, "a", 1), (1, "b", 2), (2, "a", 3), (4, "a", 3)],
+        [(0, "a", 1), (1, "a", 0), (1, "b", 2), (2, "b", 3), (3, "a", 2), (3, "a", 4)],
+    ],
+)
+def test_scc_transitive_closure(transitions):
+    nfa = NondeterministicFiniteAutomaton()
+    nfa.add_transitions(transitions)
+
+    expected_tc = BooleanMatrices(nfa).make_transitive_closure()
+    actual_tc = BooleanMatrices(nfa).make_transitive_closure(engine=SCC_CLOSURE)
+
+    assert (expected_tc != actual_tc).nnz == 0
+
+
+def test_restrict(nfa):
+    nfa.add_start_state(0)
+    nfa.add_start_state(4)
+    nfa.add_final_state(4)
+
+    bm = BooleanMatrices(nfa).restrict({"X", "Y"})
+
+    assert bm.bool_matrices.keys() == {"X", "Y"}
+    assert bm.get_states() == {0, 1, 2, 4}
+    assert bm.start_states == {0, 4} and bm.final_states == {4}
+    assert bm.bool_matrices["X"].nnz == 2 and bm.bool_matrices["Y"].nnz == 1
@@ -4,10 +4,19 @@ from pyformlang.finite_automaton import (
     DeterministicFiniteAutomaton,
 )
 
-from project import BooleanMatrices, intersect_boolean_matrices, convert_bm_to_automaton
+import pytest
+
+from project import (
+    BooleanMatrices,
+    intersect_boolean_matrices,
+    convert_bm_to_automaton,
+    KRONECKER_INTERSECTION,
+    ON_THE_FLY_INTERSECTION,
+)
 
 
-def test_intersection():
+@pytest.mark.parametrize("mode", [KRONECKER_INTERSECTION, ON_THE_FLY_INTERSECTION])
+def test_intersection(mode):
     fa1 = NondeterministicFiniteAutomaton()
     fa1.add_transitions(
         [(0, "X", 1), (0, "Y", 1), (0, "Z", 0), (1, "Y", 1), (1, "Z", 2), (2, "S", 0)]
@@ -31,8 +40,54 @@ def test_intersection():
     expected_fa.add_start_state(State(0))
     expected_fa.add_final_state(State(1))
 
-    intersected_bm = intersect_boolean_matrices(bm1, bm2)
+    intersected_bm = intersect_boolean_matrices(bm1, bm2, mode)
 
     actual_fa = convert_bm_to_automaton(intersected_bm)
 
     assert actual_fa.is_equivalent_to(expected_fa)
+
+
+def test_on_the_fly_intersection_skips_unreachable_states():
+    fa1 = NondeterministicFiniteAutomaton()
+    fa1.add_transitions([(0, "X", 1), (2, "X", 3), (3, "Y", 2)])
+    fa1.add_start_state(State(0))
+    fa1.add_final_state(State(1))
+
+    fa2 = NondeterministicFiniteAutomaton()
+    fa2.add_transitions([(0, "X", 1), (1, "Y", 0)])
+    fa2.add_start_state(State(0))
+    fa2.add_final_state(State(1))
+
+    intersected_bm = intersect_boolean_matrices(
+        BooleanMatrices(fa1), BooleanMatrices(fa2), ON_THE_FLY_INTERSECTION
+    )
+
+    assert intersected_bm.states_count == 2
+    assert set(intersected_bm.bool_matrices.keys()) == {"X"}
+    assert len(intersected_bm.start_states) == len(intersected_bm.final_states) == 1
+
+
+def test_kronecker_intersection_states():
+    fa1 = NondeterministicFiniteAutomaton()
+    fa1.add_transitions([(0, "X", 1), (1, "Y", 2)])
+    fa1.add_start_state(State(0))
+    fa1.add_final_state(State(2))
+
+    fa2 = NondeterministicFiniteAutomaton()
+    fa2.add_transitions([(0, "X", 0), (0, "Y", 1)])
+    fa2.add_start_state(State(0))
+    fa2.add_final_state(State(0))
+    fa2.add_final_state(State(1))
+
+    bm1, bm2 = BooleanMatrices(fa1), BooleanMatrices(fa2)
+    intersected_bm = intersect_boolean_matrices(bm1, bm2)
+
+    def product_state(fst, snd):
+        return bm1.state_indices[fst] * bm2.states_count + bm2.state_indices[snd]
+
+    assert intersected_bm.states_count == len(intersected_bm.state_indices) == 6
+    assert intersected_bm.start_states == {product_state(State(0), State(0))}
+    assert intersected_bm.final_states == {
+        product_state(State(2), State(0)),
+        product_state(State(2), State(1)),
+    }
@@ -0,0 +1,65 @@
+import random
+
+import networkx as nx
+import pytest
+from cfpq_data import labeled_cycle_graph
+from pyformlang.cfg import CFG
+
+from project import MultipleSourceCfpq, create_two_cycles_graph, hellings_cfpq
+
+
+@pytest.mark.parametrize(
+    "cfg",
+    [
+        "S -> a S b | a b",
+        "S -> S S | a | epsilon",
+        "S -> A B\nA -> a A | a\nB -> B b | b",
+        "S -> A B\nA -> a | epsilon\nB -> epsilon",
+    ],
+)
+def test_queries_match_all_pairs(cfg):
+    graph = create_two_cycles_graph(3, 2, ("a", "b"))
+    graph.add_node(6)
+    cfg = CFG.from_text(cfg)
+    all_pairs = hellings_cfpq(graph, cfg)
+    engine = MultipleSourceCfpq(graph, cfg)
+
+    rng = random.Random(5)
+    for _ in range(6):
+        start_nodes = set(rng.sample(range(7), rng.randint(1, 3)))
+        final_nodes = rng.choice([None, set(rng.sample(range(7), 3))])
+
+        expected = {
+            (u, v)
+            for u, v in all_pairs
+            if u in start_nodes and (final_nodes is None or v in final_nodes)
+        }
+        assert engine.query(start_nodes, final_nodes) == expected
+
+
+def test_start_variable():
+    graph = labeled_cycle_graph(3, "a", verbose=False)
+    cfg = CFG.from_text("A -> a A | epsilon\nB -> b B | b")
+
+    assert MultipleSourceCfpq(graph, cfg, "A").query({0}, {0, 1}) == {(0, 0), (0, 1)}
+    assert MultipleSourceCfpq(graph, cfg, "B").query({0}) == set()
+
+
+def test_absent_node():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+
+    with pytest.raises(ValueError):
+        MultipleSourceCfpq(graph, CFG.from_text("S -> a")).query({2})
+
+
+def test_probe():
+    graph = labeled_cycle_graph(3, "a", verbose=False)
+    cfg = CFG.from_text("S -> a S | a")
+
+    unfinished = MultipleSourceCfpq(graph, cfg).probe({0}, 1)
+    assert unfinished.rounds == 1 and not unfinished.finished
+
+    rounds, finished, facts = MultipleSourceCfpq(graph, cfg).probe({0}, 100)
+    assert finished and rounds < 100
+    assert facts["S"] == 3
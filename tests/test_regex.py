@@ -1,7 +1,7 @@
 import pytest
 from pyformlang.regular_expression import MisformedRegexError
 
-from project.regex import regex_to_min_dfa
+from project.regex import regex_to_min_dfa, RegexCache
 from pyformlang.finite_automaton import Symbol, State, DeterministicFiniteAutomaton
 
 regex_str = "01(2)* 3*"
@@ -72,3 +72,38 @@ def test_regex_to_dfa_accepting_words(
     assert all(dfa.accepts(word) for word in accepting_words) and not all(
         dfa.accepts(word) for word in not_accepting_words
     )
+
+
+def test_cache_hits():
+    cache = RegexCache()
+    first = cache.get("a b*")
+    second = cache.get("  a   b* ")
+
+    assert cache.stats.hits == 1 and cache.stats.misses == 1
+    assert first is second
+
+
+def test_cache_keeps_other_whitespace():
+    cache = RegexCache()
+    spaced = cache.get("a b")
+    tabbed = cache.get("a\tb")
+
+    assert cache.stats.misses == 2 and cache.stats.entries == 2
+    assert spaced.accepts(["a", "b"]) and not spaced.accepts(["a\tb"])
+    assert tabbed.accepts(["a\tb"]) and not tabbed.accepts(["a", "b"])
+
+
+def test_cache_bounds():
+    cache = RegexCache(max_entries=2)
+    for regex in ["a", "b", "c"]:
+        cache.get(regex)
+
+    assert cache.stats.entries == 2 and cache.stats.evictions == 1
+    assert not cache.evict("a") and cache.evict("c")
+
+    small_cache = RegexCache(max_elements=3)
+    small_cache.get("a b c d")
+    assert small_cache.stats.entries == 0
+
+    cache.clear()
+    assert cache.stats == (0, 0, 0, 0, 0)
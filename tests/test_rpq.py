@@ -1,9 +1,37 @@
 from itertools import product
 
 import networkx as nx
+import numpy as np
 import pytest
 
-from project import create_two_cycles_graph, rpq
+from project import (
+    BooleanMatrices,
+    get_reachable,
+    intersect_boolean_matrices,
+    regex_to_min_dfa,
+    create_two_cycles_graph,
+    rpq,
+    rpq_batch,
+    rpq_iter,
+    rpq_exists,
+    KRONECKER_INTERSECTION,
+    ON_THE_FLY_INTERSECTION,
+    ALL_PAIRS_EVALUATION,
+    MULTI_SOURCE_EVALUATION,
+    BIDIRECTIONAL_EVALUATION,
+)
+
+
+@pytest.fixture(params=[KRONECKER_INTERSECTION, ON_THE_FLY_INTERSECTION])
+def intersection_mode(request):
+    return request.param
+
+
+@pytest.fixture(
+    params=[ALL_PAIRS_EVALUATION, MULTI_SOURCE_EVALUATION, BIDIRECTIONAL_EVALUATION]
+)
+def evaluation(request):
+    return request.param
 
 
 @pytest.fixture
@@ -25,6 +53,16 @@ def acyclic_graph():
     return graph
 
 
+# minimal DFA of queries over this graph has several final states
+@pytest.fixture
+def several_finals_graph():
+    graph = nx.MultiDiGraph()
+    graph.add_edges_from(
+        [(0, 1, {"label": "a"}), (0, 2, {"label": "a"}), (2, 1, {"label": "b"})]
+    )
+    return graph
+
+
 @pytest.mark.parametrize(
     "query, start_nodes, final_nodes, expected_rpq",
     [
@@ -40,27 +78,150 @@ def acyclic_graph():
         ("Y*", {0}, {5, 4}, {(0, 5), (0, 4)}),
     ],
 )
-def test_rpq(graph, query, start_nodes, final_nodes, expected_rpq):
-    actual_rpq = rpq(graph, query, start_nodes, final_nodes)
+def test_rpq(
+    graph, query, start_nodes, final_nodes, expected_rpq, intersection_mode, evaluation
+):
+    actual_rpq = rpq(
+        graph, query, start_nodes, final_nodes, intersection_mode, evaluation
+    )
 
     assert actual_rpq == expected_rpq
 
 
-def test_empty_graph(empty_graph):
-    actual_rpq = rpq(empty_graph, "X|Y")
+def test_empty_graph(empty_graph, intersection_mode, evaluation):
+    actual_rpq = rpq(
+        empty_graph, "X|Y", intersection_mode=intersection_mode, evaluation=evaluation
+    )
     assert actual_rpq == set()
 
 
-def test_incorrect_labels_query(graph):
-    actual_rpq = rpq(graph, "W|Z")
+def test_incorrect_labels_query(graph, intersection_mode, evaluation):
+    actual_rpq = rpq(
+        graph, "W|Z", intersection_mode=intersection_mode, evaluation=evaluation
+    )
     assert actual_rpq == set()
 
 
-def test_acyclic_graph(acyclic_graph):
-    actual_rpq = rpq(acyclic_graph, "X Y Y")
+def test_acyclic_graph(acyclic_graph, intersection_mode, evaluation):
+    actual_rpq = rpq(
+        acyclic_graph,
+        "X Y Y",
+        intersection_mode=intersection_mode,
+        evaluation=evaluation,
+    )
     assert actual_rpq == {(0, 3)}
 
 
-def test_empty_graph_empty_query(empty_graph):
-    actual_rpq = rpq(empty_graph, "")
+def test_empty_graph_empty_query(empty_graph, evaluation):
+    actual_rpq = rpq(empty_graph, "", evaluation=evaluation)
     assert actual_rpq == set()
+
+
+def test_get_reachable_arrays():
+    graph_bm = BooleanMatrices.from_edge_arrays(
+        [0, 1, 2], ["X", "Y", "Y"], [1, 2, 3], 4
+    )
+    query_bm = BooleanMatrices(regex_to_min_dfa("X Y*"))
+    intersected_bm = intersect_boolean_matrices(graph_bm, query_bm)
+
+    nodes_from, nodes_to = get_reachable(intersected_bm, query_bm, as_set=False)
+
+    assert isinstance(nodes_from, np.ndarray) and isinstance(nodes_to, np.ndarray)
+    assert set(zip(nodes_from.tolist(), nodes_to.tolist())) == {
+        (0, 1),
+        (0, 2),
+        (0, 3),
+    }
+
+
+def test_get_reachable_arrays_several_final_states():
+    graph_bm = BooleanMatrices.from_edge_arrays(
+        [0, 0, 2], ["X", "X", "Y"], [1, 2, 1], 3
+    )
+    query_bm = BooleanMatrices(regex_to_min_dfa("X | X Y"))
+    intersected_bm = intersect_boolean_matrices(graph_bm, query_bm)
+
+    nodes_from, nodes_to = get_reachable(intersected_bm, query_bm, as_set=False)
+
+    assert sorted(zip(nodes_from.tolist(), nodes_to.tolist())) == [(0, 1), (0, 2)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rpq_batch(graph, workers):
+    queries = ["X*|Y", "Y*", "X Y", "W"]
+
+    actual = rpq_batch(graph, queries, {0, 4}, {0, 1, 5}, workers=workers)
+
+    assert actual == [rpq(graph, query, {0, 4}, {0, 1, 5}) for query in queries]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 64])
+def test_rpq_iter(graph, batch_size):
+    pairs = list(rpq_iter(graph, "X*|Y", batch_size=batch_size))
+
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == rpq(graph, "X*|Y")
+
+
+@pytest.mark.parametrize("batch_size", [1, 64])
+def test_rpq_iter_several_final_states(several_finals_graph, batch_size):
+    pairs = list(rpq_iter(several_finals_graph, "a | a b", batch_size=batch_size))
+
+    assert sorted(pairs) == [(0, 1), (0, 2)]
+
+
+def test_rpq_iter_early_stop(graph):
+    pairs = rpq_iter(graph, "X*|Y", {0, 4}, batch_size=1)
+
+    assert next(pairs)[0] == 0
+
+
+@pytest.mark.parametrize(
+    "start_nodes, batch_size",
+    [
+        (None, 0),
+        ({42}, 64),
+    ],
+)
+def test_rpq_iter_raises_on_call(graph, start_nodes, batch_size):
+    with pytest.raises(ValueError):
+        rpq_iter(graph, "X*|Y", start_nodes, batch_size=batch_size)
+
+
+@pytest.mark.parametrize(
+    "query, start_nodes, final_nodes, expected",
+    [
+        ("X*|Y", {0}, {3}, True),
+        ("X X X X", {0}, {0}, True),
+        ("Y", {0}, {0, 1, 2, 3}, False),
+        ("Y*", {4}, {0}, True),
+        ("X X X", {0}, {0}, False),
+        ("W", None, None, False),
+    ],
+)
+def test_rpq_exists(graph, query, start_nodes, final_nodes, expected):
+    assert rpq_exists(graph, query, start_nodes, final_nodes) == expected
+    assert expected == bool(rpq(graph, query, start_nodes, final_nodes))
+
+
+@pytest.mark.parametrize("limit", [0, 3, 100])
+def test_rpq_limit(graph, limit):
+    full = rpq(graph, "X* Y*")
+
+    actual = rpq(graph, "X* Y*", limit=limit)
+
+    assert actual <= full and len(actual) == min(limit, len(full))
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_rpq_limit_several_final_states(several_finals_graph, limit):
+    full = rpq(several_finals_graph, "a | a b")
+
+    actual = rpq(several_finals_graph, "a | a b", limit=limit)
+
+    assert actual <= full and len(actual) == min(limit, len(full))
+
+
+def test_rpq_exists_only(graph):
+    assert rpq(graph, "X X X X", {0}, {0}, exists_only=True) is True
+    assert rpq(graph, "X X X", {0}, {0}, exists_only=True) is False